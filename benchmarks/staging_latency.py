@@ -0,0 +1,132 @@
+"""قياس زمن تحميل ← تحديد الملف ← stat ← فتح ورفع مقطع صغير عبر STAGING_DIR مقابل VIDEOS_DIR
+
+python benchmarks/staging_latency.py --size-mb 4 --runs 5
+
+التحميل من خادم HTTP محلي عبر VideoDownloader.download، والرفع عبر StreamingUploader إلى Bot API وهمي.
+أرقام القرص تشمل ذاكرة الصفحات (page cache)، فالفرق يظهر أكثر مع قرص بطيء أو ضغط على الذاكرة.
+"""
+import argparse
+import functools
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import bott  # noqa: E402
+from upload_rss import DiscardBotApi  # noqa: E402
+
+
+class QuietFileServer(SimpleHTTPRequestHandler):
+    def copyfile(self, source, outputfile):
+        # yt-dlp يقطع الاتصال بعد قراءة الترويسات أثناء الاستخراج
+        try:
+            super().copyfile(source, outputfile)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+class KnownSizeDownloader(bott.VideoDownloader):
+    """المستخرج العام لا يعلن حجم الروابط المباشرة، فنعلنه كما تفعل المنصات التي تعيد filesize"""
+
+    size = 0
+
+    def estimated_size(self, info):
+        return self.size
+
+
+def start_server(handler) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run_once(downloader: KnownSizeDownloader, uploader: bott.StreamingUploader, url: str, name: str) -> dict:
+    started = time.perf_counter()
+    file_path, info = downloader.download(url, "best", name)
+    downloaded = time.perf_counter()
+    if file_path is None:
+        raise SystemExit(f"download failed: {info}")
+
+    size = Path(file_path).stat().st_size
+    statted = time.perf_counter()
+
+    uploader.send_video(1, Path(file_path))
+    uploaded = time.perf_counter()
+    Path(file_path).unlink()
+    return {
+        "download": downloaded - started,
+        "stat": statted - downloaded,
+        "upload": uploaded - statted,
+        "total": uploaded - started,
+        "staged": Path(file_path).parent == downloader.staging_path,
+        "size": size,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size-mb", type=float, default=4, help="حجم المقطع (يجب أن يكون ضمن STAGING_MAX_MB)")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--staging-dir", default=str(bott.STAGING_DIR or "/dev/shm/video-bot"), help="مجلد tmpfs")
+    parser.add_argument("--work-dir", help="مكان data/videos المؤقت، يجب أن يكون على القرص لا على tmpfs")
+    args = parser.parse_args()
+
+    size = int(args.size_mb * 1024 * 1024)
+    if size > bott.STAGING_MAX_MB * 1024 * 1024:
+        raise SystemExit(f"--size-mb must not exceed STAGING_MAX_MB ({bott.STAGING_MAX_MB})")
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(dir=args.work_dir) as tmp:
+        os.chdir(tmp)
+        try:
+            bott.VIDEOS_DIR.mkdir(parents=True, exist_ok=True)
+            source = Path(tmp) / "source"
+            source.mkdir()
+            (source / "clip.mp4").write_bytes(os.urandom(size))
+
+            files = start_server(functools.partial(QuietFileServer, directory=str(source)))
+            api = start_server(DiscardBotApi)
+            url = f"http://127.0.0.1:{files.server_port}/clip.mp4"
+            uploader = bott.StreamingUploader("0:bench")
+            uploader.api_url = f"http://127.0.0.1:{api.server_port}/bot0:bench"
+
+            staging_dir = Path(args.staging_dir) / f"bench-{os.getpid()}"
+            variants = [
+                ("STAGING_DIR", KnownSizeDownloader(bott.VIDEOS_DIR, staging_dir)),
+                ("VIDEOS_DIR", KnownSizeDownloader(bott.VIDEOS_DIR, None)),
+            ]
+            if variants[0][1].staging_path is None:
+                raise SystemExit(f"cannot use {staging_dir} for staging")
+
+            print(f"{'المسار':<12} {'تحميل':>9} {'stat':>9} {'رفع':>9} {'المجموع':>9}   (مللي ثانية، الوسيط من {args.runs}، {args.size_mb} MB)")
+            for label, downloader in variants:
+                downloader.size = size
+                results = [run_once(downloader, uploader, url, f"bench_{i}") for i in range(args.runs)]
+                if label == "STAGING_DIR" and not all(r["staged"] for r in results):
+                    raise SystemExit("the clip was not staged; check free space in the staging dir")
+                median = {key: statistics.median(r[key] for r in results) * 1000
+                          for key in ("download", "stat", "upload", "total")}
+                print(f"{label:<12} {median['download']:>9.1f} {median['stat']:>9.3f} "
+                      f"{median['upload']:>9.1f} {median['total']:>9.1f}")
+
+            try:
+                staging_dir.rmdir()
+            except OSError:
+                pass
+            files.shutdown()
+            api.shutdown()
+        finally:
+            os.chdir(cwd)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""قياس زمن الإقلاع حتى معالجة أول تحديث، مقابل خادم Bot API وهمي يعيد رسالة /start واحدة
+
+python benchmarks/startup.py --users 50000 --runs 3 --rev <commit>
+
+كل تشغيل في عملية جديدة (استيراد نظيف). مع --rev يُقاس أيضاً bott.py من تلك النسخة للمقارنة.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import ThreadingHTTPServer
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "tests"))
+
+from test_local_bot_api import TOKEN, StubBotApi  # noqa: E402
+
+START_UPDATE = {
+    "update_id": 1,
+    "message": {
+        "message_id": 1,
+        "date": 0,
+        "chat": {"id": 5, "type": "private"},
+        "from": {"id": 5, "is_bot": False, "first_name": "bench"},
+        "text": "/start",
+        "entities": [{"type": "bot_command", "offset": 0, "length": 6}],
+    },
+}
+
+
+class UpdatesStub(StubBotApi):
+    """يعيد تحديثاً واحداً من getUpdates ويسجل لحظة أول رد من البوت"""
+
+    pending = [START_UPDATE]
+    replied = threading.Event()
+
+    def _result(self, method: str):
+        if method == "getUpdates":
+            updates, UpdatesStub.pending = UpdatesStub.pending, []
+            if not updates:
+                time.sleep(0.05)
+            return updates
+        if method == "sendMessage":
+            UpdatesStub.replied.set()
+        if method in ("deleteWebhook", "setMyCommands"):
+            return True
+        return super()._result(method)
+
+
+def child(bott_dir: str):
+    started = time.perf_counter()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), UpdatesStub)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    os.environ["BOT_API_BASE_URL"] = f"http://127.0.0.1:{server.server_port}/bot"
+    os.environ["WORKER_PROCESSES"] = "0"
+    sys.path.insert(0, bott_dir)
+
+    import_started = time.perf_counter()
+    import bott
+    imported = time.perf_counter()
+
+    bot = bott.VideoBot(TOKEN)
+    initialized = time.perf_counter()
+
+    # run() كما في التشغيل الحقيقي، بدون idle() التي تنتظر إشارة الإيقاف
+    bot.updater.idle = lambda *args, **kwargs: None
+    with contextlib.redirect_stdout(io.StringIO()):
+        bot.run()
+    polling = time.perf_counter()
+
+    if not UpdatesStub.replied.wait(60):
+        raise SystemExit("no reply to the first update")
+    replied = time.perf_counter()
+
+    print(json.dumps({
+        "import": imported - import_started,
+        "init": initialized - imported,
+        "polling": polling - started,
+        "first_update": replied - started,
+    }))
+    sys.stdout.flush()
+    os._exit(0)
+
+
+def write_users(path: Path, count: int):
+    users = {
+        str(i): {
+            "id": i, "first_name": f"user{i}", "username": f"name{i}", "downloads": i % 50,
+            "joined": "2024-01-01T00:00:00", "last_active": "2024-01-01T00:00:00", "total_size_mb": 0
+        }
+        for i in range(count)
+    }
+    path.write_text(json.dumps(users), encoding="utf-8")
+
+
+def measure(label: str, bott_dir: Path, users: int, runs: int) -> dict:
+    results = []
+    for _ in range(runs):
+        with tempfile.TemporaryDirectory() as cwd:
+            for name in ("temp", "data/videos", "data/logs", "data/exports"):
+                (Path(cwd) / name).mkdir(parents=True, exist_ok=True)
+            write_users(Path(cwd) / "data" / "users.json", users)
+            output = subprocess.run(
+                [sys.executable, __file__, "--child", str(bott_dir)],
+                cwd=cwd, capture_output=True, text=True, timeout=300
+            )
+            lines = [line for line in output.stdout.splitlines() if line.startswith("{")]
+            if output.returncode or not lines:
+                raise SystemExit(f"{label}: {output.stderr[-2000:]}")
+            results.append(json.loads(lines[-1]))
+    return {key: statistics.median(r[key] for r in results) for key in results[0]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=50000, help="عدد المستخدمين في users.json")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--rev", action="append", default=[], help="نسخة git من bott.py للمقارنة")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child)
+        return
+
+    variants = [("الحالية", ROOT)]
+    tmp = tempfile.TemporaryDirectory()
+    for rev in args.rev:
+        rev_dir = Path(tmp.name) / rev.replace("/", "_").replace("^", "_").replace("~", "_")
+        rev_dir.mkdir()
+        source = subprocess.run(["git", "show", f"{rev}:bott.py"], cwd=ROOT, capture_output=True, check=True)
+        (rev_dir / "bott.py").write_bytes(source.stdout)
+        variants.append((rev, rev_dir))
+
+    print(f"{'النسخة':<16} {'استيراد':>9} {'التهيئة':>9} {'الاستقبال':>10} {'أول تحديث':>10}   (ثوانٍ، الوسيط من {args.runs})")
+    for label, bott_dir in variants:
+        r = measure(label, bott_dir, args.users, args.runs)
+        print(f"{label:<16} {r['import']:>9.3f} {r['init']:>9.3f} {r['polling']:>10.3f} {r['first_update']:>10.3f}")
+    tmp.cleanup()
+
+
+if __name__ == "__main__":
+    main()
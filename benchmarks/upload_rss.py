@@ -0,0 +1,98 @@
+"""قياس الذاكرة الحالية (RSS) أثناء N عملية رفع متزامنة عبر StreamingUploader
+
+python benchmarks/upload_rss.py --size-mb 40 --concurrency 1 2 4 8
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bott import StreamingUploader  # noqa: E402
+
+
+class DiscardBotApi(BaseHTTPRequestHandler):
+    """يقرأ جسم الطلب على دفعات ويتجاهله حتى لا يدخل الخادم في القياس"""
+
+    def do_POST(self):
+        remaining = int(self.headers.get('Content-Length') or 0)
+        while remaining > 0:
+            chunk = self.rfile.read(min(remaining, 256 * 1024))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+        payload = json.dumps({"ok": True, "result": {}}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+def sample_rss(stop: threading.Event, samples: list, interval: float):
+    while not stop.is_set():
+        samples.append(StreamingUploader.current_rss_mb())
+        time.sleep(interval)
+
+
+def run(uploader: StreamingUploader, video: Path, concurrency: int, interval: float) -> dict:
+    samples, stop = [], threading.Event()
+    sampler = threading.Thread(target=sample_rss, args=(stop, samples, interval), daemon=True)
+    baseline = StreamingUploader.current_rss_mb()
+    started = time.monotonic()
+    sampler.start()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(lambda i: uploader.send_video(i, video), range(concurrency)))
+    stop.set()
+    sampler.join()
+    return {
+        "concurrency": concurrency,
+        "baseline_mb": baseline,
+        "peak_mb": max(samples or [baseline]),
+        "seconds": time.monotonic() - started,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size-mb", type=int, default=40, help="حجم الملف المرفوع")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--interval", type=float, default=0.02, help="الفاصل بين عينات RSS بالثواني")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), DiscardBotApi)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    uploader = StreamingUploader("0:bench")
+    uploader.api_url = f"http://127.0.0.1:{server.server_port}/bot0:bench"
+
+    with tempfile.TemporaryDirectory() as tmp:
+        video = Path(tmp) / "bench.mp4"
+        with open(video, 'wb') as f:
+            for _ in range(args.size_mb):
+                f.write(os.urandom(1024 * 1024))
+
+        print(f"{'N':>4} {'RSS قبل':>10} {'RSS أقصى':>10} {'الزيادة':>10} {'ثانية':>8}")
+        for n in args.concurrency:
+            r = run(uploader, video, n, args.interval)
+            print(
+                f"{r['concurrency']:>4} {r['baseline_mb']:>10.1f} {r['peak_mb']:>10.1f} "
+                f"{r['peak_mb'] - r['baseline_mb']:>10.1f} {r['seconds']:>8.2f}"
+            )
+
+    server.shutdown()
+    server.server_close()
+
+
+if __name__ == "__main__":
+    main()
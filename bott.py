@@ -3,37 +3,57 @@
 بوت تيليجرام لتحميل الفيديوهات من يوتيوب، انستغرام، تيك توك، تويتر، فيسبوك
 """
 
+import time
+_STARTED_AT = time.monotonic()  # لقياس زمن الإقلاع حتى أول تحديث
+
 import os
+import sys
+import copy
+import errno
 import json
+import gzip
+import atexit
 import logging
+import logging.handlers
 import html
-import time
 import hashlib
 import shutil
 import zipfile
+import bisect
+import sqlite3
+import subprocess
+from contextlib import ExitStack, nullcontext
 from datetime import datetime
 from pathlib import Path
 from typing import Optional, Dict, Any, List
 import re
+import math
+import itertools
+import socket
 import threading
+import multiprocessing
+from collections import OrderedDict, deque
 from queue import Queue
 
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, KeyboardButton
+from telegram import (
+    Update, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, KeyboardButton,
+    InputMediaVideo, InputMediaAudio, InlineQueryResultCachedVideo, InlineQueryResultCachedAudio
+)
 try:
     from telegram.ext import (
         Updater, CommandHandler, MessageHandler, CallbackQueryHandler,
-        Filters, CallbackContext, ConversationHandler
+        Filters, CallbackContext, ConversationHandler, TypeHandler, InlineQueryHandler
     )
 except ImportError:
     # Handle PTB v20 compatibility
     from telegram.ext import (
         Application as Updater, CommandHandler, MessageHandler, CallbackQueryHandler,
-        filters as Filters, CallbackContext, ConversationHandler
+        filters as Filters, CallbackContext, ConversationHandler, TypeHandler, InlineQueryHandler
     )
     # Note: v20 is async, so this is just a name shim. 
     # But since the user is using v13 style, we should probably stick to v13 or fix the environment.
 
-import yt_dlp
+from telegram.error import TelegramError
 
 from dotenv import load_dotenv
 
@@ -45,43 +65,200 @@ TOKEN = os.getenv("TOKEN")
 ADMIN_ID = int(os.getenv("ADMIN_ID", "7265784246"))  # معرف الآدمين
 CHANNEL_ID = os.getenv("CHANNEL_ID", "@your_channel_username")  # معرف القناة (عدله لاحقاً)
 
+# ==================== خادم Bot API ====================
+# لخادم telegram-bot-api محلي (--local): مثال http://localhost:8081/bot
+BOT_API_BASE_URL = os.getenv("BOT_API_BASE_URL")
+BOT_API_BASE_FILE_URL = os.getenv("BOT_API_BASE_FILE_URL")
+LOCAL_BOT_API = bool(BOT_API_BASE_URL)
+
 # ==================== الإعدادات المتقدمة ====================
-MAX_FILE_SIZE = 50 * 1024 * 1024  # 50 ميجابايت
+# الخادم العام يقبل 50 ميجابايت فقط، الخادم المحلي يصل إلى 2000 ميجابايت
+MAX_FILE_SIZE = int(os.getenv("MAX_FILE_SIZE_MB", "2000" if LOCAL_BOT_API else "50")) * 1024 * 1024
 MAX_DURATION = 30 * 60  # 30 دقيقة
+MAX_AUDIO_DURATION = int(os.getenv("MAX_AUDIO_DURATION_MIN", "180")) * 60  # الصوت أصغر بكثير، فيُسمح بمدة أطول
 DOWNLOAD_TIMEOUT = 300  # 5 دقائق
+POSTPROCESS_TIMEOUT = 120  # مهلة ffmpeg/ffprobe بالثواني
+UPLOAD_CHUNK_SIZE = 256 * 1024  # حجم الدفعة عند رفع الفيديو من القرص
+TICKETS_PAGE_SIZE = 8  # عدد تذاكر الدعم في الصفحة
+USERS_PAGE_SIZE = 15  # عدد المستخدمين في صفحة لوحة المشرف
+BATCH_MAX_URLS = int(os.getenv("BATCH_MAX_URLS", "10"))  # أقصى عدد روابط تُقبل من رسالة واحدة
+MEDIA_GROUP_SIZE = 10  # حد تيليجرام لعناصر sendMediaGroup
+URL_TTL = 24 * 3600  # صلاحية أزرار الجودة
+URL_REGISTRY_MAX = int(os.getenv("URL_REGISTRY_MAX", "50000"))  # أقصى عدد روابط في الذاكرة
+URL_REGISTRY_PERSIST = os.getenv("URL_REGISTRY_PERSIST", "0") == "1"  # حفظ الروابط لتعمل الأزرار بعد إعادة التشغيل
+FAILURE_CACHE_MAX = int(os.getenv("FAILURE_CACHE_MAX", "10000"))  # أقصى عدد روابط فاشلة محفوظة
+
+# ==================== التسجيل ====================
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_MB", "10")) * 1024 * 1024  # حجم ملف السجل قبل التدوير
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "5"))  # عدد النسخ المضغوطة المحفوظة
+YTDLP_DEBUG_SAMPLE = int(os.getenv("YTDLP_DEBUG_SAMPLE", "50"))  # تسجيل رسالة debug واحدة من كل N من yt-dlp
+
+# ==================== عمال التحميل ====================
+WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", "0"))  # 0 = التحميل داخل عملية البوت نفسها
+JOB_POLL_INTERVAL = 0.5  # ثواني بين كل فحص لطابور المهام
+JOB_QUEUE_TIMEOUT = int(os.getenv("JOB_QUEUE_TIMEOUT", "1800"))  # أقصى انتظار قبل أن يأخذ عامل المهمة
+WORKER_CHECK_INTERVAL = 30  # ثواني بين كل فحص لعمليات العمال
+JOURNAL_MAX_AGE = 6 * 3600  # الطلبات الأقدم من ذلك لا تُستأنف بعد إعادة التشغيل
+
+# ==================== حدود الاستخدام ====================
+DOWNLOAD_WORKERS = int(os.getenv("DOWNLOAD_WORKERS", str(max(2, WORKER_PROCESSES))))  # عدد التحميلات المتزامنة
+RATE_LIMIT_PER_MINUTE = float(os.getenv("RATE_LIMIT_PER_MINUTE", "4"))  # معدل تعبئة رموز كل مستخدم
+RATE_LIMIT_BURST = int(os.getenv("RATE_LIMIT_BURST", "3"))  # أقصى عدد طلبات متتالية
+MAX_JOBS_PER_USER = int(os.getenv("MAX_JOBS_PER_USER", "2"))  # عمليات جارية/منتظرة لكل مستخدم
+SUPPORT_REPORT_LIMIT = 5000  # أقصى عدد رسائل في تقرير HTML
+FFMPEG_BIN = os.getenv("FFMPEG_BIN", "ffmpeg")
+FFPROBE_BIN = os.getenv("FFPROBE_BIN", "ffprobe")
+STAGING_MAX_MB = int(os.getenv("STAGING_MAX_MB", "16"))  # المقاطع الأصغر تُحمّل إلى الذاكرة (0 للتعطيل)
 
 # ==================== المجلدات ====================
 TEMP_DIR = Path("temp")
 DATA_DIR = Path("data")
 VIDEOS_DIR = DATA_DIR / "videos"
+# مجلد في tmpfs للمقاطع الصغيرة، لا يُستخدم مع خادم Bot API المحلي لأنه يقرأ الملفات من مساره،
+# ولا في العمال المستقلين (python bott.py worker) لأنهم قد يعملون على جهاز آخر يشارك data/ فقط
+STAGING_DIR = Path(os.getenv("STAGING_DIR", "/dev/shm/video-bot")) if STAGING_MAX_MB > 0 and not LOCAL_BOT_API else None
 LOGS_DIR = DATA_DIR / "logs"
 USERS_FILE = DATA_DIR / "users.json"
 MESSAGES_HTML = LOGS_DIR / "messages.html"
+SUPPORT_DB = LOGS_DIR / "support.db"
+JOBS_DB = DATA_DIR / "jobs.db"
+JOURNAL_DB = DATA_DIR / "journal.db"
+URLS_DB = DATA_DIR / "urls.db"
+MEDIA_DB = DATA_DIR / "media.db"
+STAGING_LOCK = DATA_DIR / "staging.lock"  # قفل حجز مساحة الذاكرة بين عمليات العمال
 VIDEOS_ZIP = DATA_DIR / "exports" / "videos.zip"
 
-# إنشاء المجلدات
-for dir_path in [TEMP_DIR, DATA_DIR, VIDEOS_DIR, LOGS_DIR, DATA_DIR / "exports"]:
-    dir_path.mkdir(parents=True, exist_ok=True)
-
-# ==================== إعدادات التسجيل ====================
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO,
-    handlers=[
-        logging.FileHandler(DATA_DIR / 'bot.log', encoding='utf-8'),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger(__name__)
 
+# ==================== التهيئة ====================
+class JsonFormatter(logging.Formatter):
+    """سطر JSON لكل سجل مع الحقول المهيكلة الممررة عبر extra"""
+    
+    FIELDS = ("user_id", "job_id", "platform", "stage", "elapsed", "size_mb", "worker", "staged")
+    
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for field in self.FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                data[field] = round(value, 3) if isinstance(value, float) else value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data["exc"] = record.exc_text
+        return json.dumps(data, ensure_ascii=False)
+
+
+class StructuredQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler يدمج التتبع داخل الرسالة، وهنا نبقيه في exc_text ليصل حقلاً مستقلاً"""
+    
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def _gzip_rotator(source: str, dest: str):
+    with open(source, 'rb') as src, gzip.open(dest, 'wb') as dst:
+        shutil.copyfileobj(src, dst)
+    os.remove(source)
+
+
+def setup_runtime(log_name: str = "bot"):
+    """إنشاء المجلدات وإعداد التسجيل عند التشغيل فقط، لا عند استيراد الملف"""
+    for dir_path in [TEMP_DIR, DATA_DIR, VIDEOS_DIR, LOGS_DIR, DATA_DIR / "exports"]:
+        dir_path.mkdir(parents=True, exist_ok=True)
+    
+    # الكتابة للقرص والضغط يتمان في خيط QueueListener، والخيط المستدعي يضع السجل في طابور فقط
+    file_handler = logging.handlers.RotatingFileHandler(
+        DATA_DIR / f"{log_name}.log",
+        maxBytes=LOG_MAX_BYTES,
+        backupCount=LOG_BACKUP_COUNT,
+        encoding='utf-8'
+    )
+    file_handler.namer = lambda name: f"{name}.gz"
+    file_handler.rotator = _gzip_rotator
+    file_handler.setFormatter(JsonFormatter())
+    
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+    
+    log_queue = Queue(-1)
+    listener = logging.handlers.QueueListener(log_queue, file_handler, stream_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    
+    root = logging.getLogger()
+    root.setLevel(LOG_LEVEL)
+    root.addHandler(StructuredQueueHandler(log_queue))
+
+
+class YtDlpLogger:
+    """yt-dlp يرسل كل سطر تقدم إلى debug، فنأخذ منها عينة ونمرر التحذيرات والأخطاء كاملة"""
+    
+    def __init__(self, sample_every: int = YTDLP_DEBUG_SAMPLE, **fields):
+        self.sample_every = sample_every
+        self.fields = fields
+        self._count = 0
+    
+    def debug(self, msg: str):
+        self._count += 1
+        if self.sample_every and self._count % self.sample_every == 1:
+            logger.debug(msg, extra=self.fields)
+    
+    def info(self, msg: str):
+        self.debug(msg)
+    
+    def warning(self, msg: str):
+        logger.warning(msg, extra=self.fields)
+    
+    def error(self, msg: str):
+        logger.error(msg, extra=self.fields)
+
+def warm_up_yt_dlp():
+    # استيراد yt-dlp ومستخرجاته يأخذ ثوانٍ، فنحمّله في الخلفية بعد بدء الاستقبال
+    try:
+        import yt_dlp
+        from yt_dlp.extractor import gen_extractor_classes
+        gen_extractor_classes()
+        logger.info(f"🔥 تم تحميل yt-dlp بعد {time.monotonic() - _STARTED_AT:.2f} ثانية من الإقلاع")
+    except Exception as e:
+        logger.warning(f"فشل تحميل yt-dlp مسبقاً: {e}")
+
 # ==================== حالات المحادثة ====================
 (WAITING_SUPPORT, WAITING_BROADCAST, WAITING_REPLY_ID, WAITING_REPLY_MSG) = range(4)
 
 # ==================== مدير قاعدة البيانات ====================
 class Database:
+    # رموز الترتيب القصيرة (لتناسب callback_data)
+    SORTS = {"d": "downloads", "j": "joined", "a": "last_active"}
+    
     def __init__(self):
         self.users_file = USERS_FILE
-        self.users = self._load_users()
+        self._users = None
+        # التعديل يتم من خيط الاستقبال وخيوط التحميل معاً، فكل تعديل وفهرسة وحفظ تحت قفل واحد
+        self._lock = threading.RLock()
+    
+    @property
+    def users(self) -> Dict:
+        # users.json يُقرأ عند أول استخدام (أو في الخلفية بعد الإقلاع) بدل قبل بدء الاستقبال
+        if self._users is None:
+            with self._lock:
+                if self._users is None:
+                    users = self._load_users()
+                    self._build_indexes(users)
+                    self._users = users
+        return self._users
     
     def _load_users(self) -> Dict:
         if self.users_file.exists():
@@ -93,65 +270,256 @@ class Database:
         return {}
     
     def _save_users(self):
-        with open(self.users_file, 'w', encoding='utf-8') as f:
-            json.dump(self.users, f, indent=2, ensure_ascii=False)
+        # الكتابة لملف مؤقت ثم استبداله، حتى لا يبقى users.json نصف مكتوب
+        tmp_file = self.users_file.with_name(f"{self.users_file.name}.tmp")
+        with self._lock:
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(self.users, f, indent=2, ensure_ascii=False)
+            os.replace(tmp_file, self.users_file)
+    
+    # ========== الفهارس ==========
+    # قوائم مرتبة من (المفتاح، id) تُحدّث مع كل تعديل، فلا نرتب كل المستخدمين عند العرض
+    
+    @staticmethod
+    def _sort_entry(field: str, user: Dict) -> tuple:
+        default = 0 if field == "downloads" else ""
+        return (user.get(field) or default, user["id"])
+    
+    @staticmethod
+    def _name_tokens(user: Dict) -> set:
+        names = (user.get("first_name"), user.get("username"))
+        return {n.lower() for n in names if n}
+    
+    def _build_indexes(self, users: Dict):
+        users = list(users.values())
+        self._sort_indexes = {
+            field: sorted(self._sort_entry(field, u) for u in users)
+            for field in self.SORTS.values()
+        }
+        self._name_index = sorted((t, u["id"]) for u in users for t in self._name_tokens(u))
+        self._totals = {
+            "downloads": sum(u.get("downloads", 0) for u in users),
+            "size_mb": sum(u.get("total_size_mb", 0) for u in users)
+        }
+    
+    @staticmethod
+    def _index_remove(index: List[tuple], entry: tuple):
+        i = bisect.bisect_left(index, entry)
+        if i < len(index) and index[i] == entry:
+            del index[i]
+    
+    def _index_user(self, user: Dict, add: bool = True):
+        entries = [(index, self._sort_entry(field, user)) for field, index in self._sort_indexes.items()]
+        entries += [(self._name_index, (token, user["id"])) for token in self._name_tokens(user)]
+        for index, entry in entries:
+            if add:
+                bisect.insort(index, entry)
+            else:
+                self._index_remove(index, entry)
     
     def add_user(self, user_id: int, first_name: str, username: str = None) -> bool:
         user_id = str(user_id)
-        if user_id not in self.users:
-            self.users[user_id] = {
-                "id": int(user_id),
-                "first_name": first_name,
-                "username": username,
-                "downloads": 0,
-                "joined": datetime.now().isoformat(),
-                "last_active": datetime.now().isoformat(),
-                "total_size_mb": 0
-            }
-            self._save_users()
-            return True
-        else:
-            self.users[user_id]["last_active"] = datetime.now().isoformat()
-            self.users[user_id]["first_name"] = first_name
-            self.users[user_id]["username"] = username
-            self._save_users()
-            return False
+        with self._lock:
+            if user_id not in self.users:
+                self.users[user_id] = {
+                    "id": int(user_id),
+                    "first_name": first_name,
+                    "username": username,
+                    "downloads": 0,
+                    "joined": datetime.now().isoformat(),
+                    "last_active": datetime.now().isoformat(),
+                    "total_size_mb": 0
+                }
+                self._index_user(self.users[user_id])
+                self._save_users()
+                return True
+            else:
+                self._index_user(self.users[user_id], add=False)
+                self.users[user_id]["last_active"] = datetime.now().isoformat()
+                self.users[user_id]["first_name"] = first_name
+                self.users[user_id]["username"] = username
+                self._index_user(self.users[user_id])
+                self._save_users()
+                return False
     
     def increment_download(self, user_id: int, size_mb: float = 0):
         user_id = str(user_id)
-        if user_id in self.users:
-            self.users[user_id]["downloads"] += 1
-            self.users[user_id]["total_size_mb"] += size_mb
-            self._save_users()
+        with self._lock:
+            if user_id in self.users:
+                user = self.users[user_id]
+                downloads_index = self._sort_indexes["downloads"]
+                self._index_remove(downloads_index, self._sort_entry("downloads", user))
+                user["downloads"] += 1
+                user["total_size_mb"] += size_mb
+                bisect.insort(downloads_index, self._sort_entry("downloads", user))
+                self._totals["downloads"] += 1
+                self._totals["size_mb"] += size_mb
+                self._save_users()
     
     def get_user(self, user_id: int) -> Dict:
-        return self.users.get(str(user_id), {})
+        with self._lock:
+            return dict(self.users.get(str(user_id), {}))
     
     def get_all_users(self) -> List[Dict]:
-        return list(self.users.values())
+        with self._lock:
+            return list(self.users.values())
     
     def get_total_stats(self) -> Dict:
-        users = self.get_all_users()
-        return {
-            "total_users": len(users),
-            "total_downloads": sum(u.get("downloads", 0) for u in users),
-            "total_size_mb": sum(u.get("total_size_mb", 0) for u in users)
-        }
+        with self._lock:
+            return {
+                "total_users": len(self.users),
+                "total_downloads": self._totals["downloads"],
+                "total_size_mb": self._totals["size_mb"]
+            }
     
     def get_top_users(self, limit: int = 10) -> List[Dict]:
-        users = self.get_all_users()
-        return sorted(users, key=lambda x: x.get("downloads", 0), reverse=True)[:limit]
+        with self._lock:
+            users = self.users
+            index = self._sort_indexes["downloads"]
+            return [users[str(uid)] for _, uid in reversed(index[-limit:])] if limit > 0 else []
+    
+    def page_users(self, sort: str = "d", cursor: tuple = None, direction: str = "next",
+                   limit: int = USERS_PAGE_SIZE) -> tuple:
+        """صفحة تنازلية حسب الترتيب، والمؤشر هو (المفتاح، id) لآخر/أول عنصر معروض"""
+        with self._lock:
+            return self._page_users(sort, cursor, direction, limit)
+    
+    def _page_users(self, sort: str, cursor: tuple, direction: str, limit: int) -> tuple:
+        users = self.users
+        index = self._sort_indexes[self.SORTS[sort]]
+        if cursor is None:
+            hi = len(index)
+        elif direction == "next":
+            hi = bisect.bisect_left(index, cursor)
+        else:
+            hi = min(len(index), bisect.bisect_right(index, cursor) + limit)
+        lo = max(0, hi - limit)
+        
+        page = [users[str(uid)] for _, uid in reversed(index[lo:hi])]
+        return page, hi < len(index), lo > 0
+    
+    def search_users(self, prefix: str, offset: int = 0, limit: int = USERS_PAGE_SIZE) -> tuple:
+        """بحث بالبادئة في الاسم الأول واسم المستخدم، والإزاحة بعدد المستخدمين لا بعناصر الفهرس"""
+        with self._lock:
+            return self._search_users(prefix, offset, limit)
+    
+    def _search_users(self, prefix: str, offset: int, limit: int) -> tuple:
+        prefix = prefix.lower().lstrip('@')
+        users = self.users
+        index = self._name_index
+        
+        # المستخدم قد يطابق باسمه واسم المستخدم معاً، فنزيل التكرار قبل التقسيم لصفحات
+        matched = OrderedDict()
+        i = bisect.bisect_left(index, (prefix,))
+        while i < len(index) and index[i][0].startswith(prefix) and len(matched) <= offset + limit:
+            matched[index[i][1]] = None
+            i += 1
+        
+        ids = list(matched)
+        results = [users[str(uid)] for uid in ids[offset:offset + limit]]
+        return results, offset + len(results), len(ids) > offset + limit
 
 # ==================== مدير السجلات ====================
 class MessageLogger:
+    """سجل رسائل الدعم في SQLite مع فهارس حسب المستخدم والوقت"""
+
     def __init__(self):
-        self.html_file = MESSAGES_HTML
-        self._init_html()
+        self.db_file = SUPPORT_DB
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(str(self.db_file), check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.fts = False
+        self._init_db()
+    
+    def _init_db(self):
+        with self._lock, self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS messages (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id INTEGER NOT NULL,
+                    username TEXT,
+                    first_name TEXT,
+                    message TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    answered_at REAL
+                )
+            """)
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_user ON messages(user_id, id)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_time ON messages(created_at)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_open ON messages(id) WHERE answered_at IS NULL")
+            # البحث النصي عبر FTS5 إن كان متوفراً في نسخة SQLite
+            try:
+                self.conn.execute(
+                    "CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts "
+                    "USING fts5(message, content='messages', content_rowid='id')"
+                )
+                self.fts = True
+            except sqlite3.OperationalError:
+                logger.warning("⚠️ FTS5 غير متوفر، سيتم البحث باستخدام LIKE")
+    
+    def log_message(self, user_id: int, username: str, first_name: str, message: str) -> int:
+        with self._lock, self.conn:
+            cur = self.conn.execute(
+                "INSERT INTO messages (user_id, username, first_name, message, created_at) VALUES (?, ?, ?, ?, ?)",
+                (user_id, username, first_name, message, time.time())
+            )
+            if self.fts:
+                self.conn.execute("INSERT INTO messages_fts (rowid, message) VALUES (?, ?)", (cur.lastrowid, message))
+            return cur.lastrowid
+    
+    def mark_answered(self, user_id: int) -> int:
+        with self._lock, self.conn:
+            cur = self.conn.execute(
+                "UPDATE messages SET answered_at = ? WHERE user_id = ? AND answered_at IS NULL",
+                (time.time(), user_id)
+            )
+            return cur.rowcount
+    
+    def count_open(self) -> int:
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM messages WHERE answered_at IS NULL").fetchone()[0]
     
-    def _init_html(self):
-        if not self.html_file.exists():
-            with open(self.html_file, 'w', encoding='utf-8') as f:
-                f.write("""<!DOCTYPE html>
+    def _filter_sql(self, mode: str, arg: str = None) -> tuple:
+        if mode == "open":
+            return "answered_at IS NULL", []
+        if mode == "user":
+            return "user_id = ?", [int(arg)]
+        if mode == "search":
+            if self.fts:
+                terms = " ".join('"%s"' % t.replace('"', '""') for t in arg.split())
+                return "id IN (SELECT rowid FROM messages_fts WHERE messages_fts MATCH ?)", [terms]
+            return "message LIKE ?", [f"%{arg}%"]
+        return "1", []
+    
+    def page(self, mode: str = "recent", arg: str = None, before: int = None,
+             after: int = None, limit: int = TICKETS_PAGE_SIZE) -> tuple:
+        """صفحة من التذاكر بالأحدث أولاً، مع مؤشر id بدل OFFSET"""
+        where, params = self._filter_sql(mode, arg)
+        if after is not None:
+            sql = f"SELECT * FROM messages WHERE {where} AND id > ? ORDER BY id ASC LIMIT ?"
+            params += [after, limit + 1]
+        else:
+            sql = f"SELECT * FROM messages WHERE {where} AND id < ? ORDER BY id DESC LIMIT ?"
+            params += [before if before is not None else 2 ** 63 - 1, limit + 1]
+        
+        with self._lock:
+            rows = [dict(r) for r in self.conn.execute(sql, params).fetchall()]
+        
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if after is not None:
+            rows.reverse()
+        return rows, has_more
+    
+    def export_html(self, mode: str = "recent", arg: str = None, limit: int = SUPPORT_REPORT_LIMIT) -> Path:
+        """تقرير HTML عند الطلب بدل ملف واحد يكبر بلا نهاية"""
+        rows, _ = self.page(mode, arg, limit=limit)
+        report_path = DATA_DIR / "exports" / f"support_{int(time.time())}.html"
+        
+        with open(report_path, 'w', encoding='utf-8') as f:
+            f.write("""<!DOCTYPE html>
 <html dir="rtl">
 <head>
     <meta charset="UTF-8">
@@ -171,22 +539,239 @@ class MessageLogger:
         <h1>📬 سجل رسائل الدعم</h1>
     </div>
 """)
-    
-    def log_message(self, user_id: int, username: str, first_name: str, message: str):
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        safe_message = html.escape(message)
-        safe_name = html.escape(first_name)
-        
-        with open(self.html_file, 'a', encoding='utf-8') as f:
-            f.write(f"""
+            for row in rows:
+                timestamp = datetime.fromtimestamp(row['created_at']).strftime("%Y-%m-%d %H:%M:%S")
+                status = "✅ تم الرد" if row['answered_at'] else "⏳ بانتظار الرد"
+                f.write(f"""
     <div class="message">
-        <div class="user-id">👤 <b>{safe_name}</b> (@{username or 'لا يوجد'})</div>
-        <div class="time">🕐 {timestamp}</div>
-        <div class="time">🆔 {user_id}</div>
-        <div class="content">💬 {safe_message}</div>
+        <div class="user-id">👤 <b>{html.escape(row['first_name'] or '')}</b> (@{html.escape(row['username'] or 'لا يوجد')})</div>
+        <div class="time">🕐 {timestamp} | #{row['id']} | {status}</div>
+        <div class="time">🆔 {row['user_id']}</div>
+        <div class="content">💬 {html.escape(row['message'])}</div>
     </div>
     <hr>
 """)
+            f.write("</body>\n</html>\n")
+        return report_path
+
+# ==================== سجل الروابط ====================
+class UrlRegistry:
+    """روابط المستخدمين بمفاتيح قصيرة لـ callback_data، مع انتهاء صلاحية وحد أقصى (LRU)"""
+    
+    ENTRY_OVERHEAD = 120  # تقدير كلفة العنصر داخل OrderedDict بالبايت
+    
+    def __init__(self, max_size: int = URL_REGISTRY_MAX, ttl: int = URL_TTL,
+                 db_file: Optional[Path] = URLS_DB if URL_REGISTRY_PERSIST else None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._items = OrderedDict()  # key -> (value, expires_at)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.conn = None
+        if db_file:
+            self.conn = sqlite3.connect(str(db_file), isolation_level=None, check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS urls (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+    
+    @classmethod
+    def _entry_size(cls, key: str, value) -> int:
+        size = sys.getsizeof(key) + sys.getsizeof(value) + cls.ENTRY_OVERHEAD
+        if isinstance(value, list):
+            size += sum(sys.getsizeof(v) for v in value)
+        return size
+    
+    def _lookup(self, key: str, now: float):
+        item = self._items.get(key)
+        if item is not None:
+            if item[1] > now:
+                return item[0]
+            self._remove(key)
+        if self.conn:
+            row = self.conn.execute("SELECT value, expires_at FROM urls WHERE key = ?", (key,)).fetchone()
+            if row and row[1] > now:
+                value = json.loads(row[0])
+                self._store(key, value, row[1])
+                return value
+        return None
+    
+    def _store(self, key: str, value, expires_at: float):
+        if key in self._items:
+            self._remove(key)
+        self._items[key] = (value, expires_at)
+        self._bytes += self._entry_size(key, value)
+        while len(self._items) > self.max_size:
+            oldest = next(iter(self._items))
+            self._remove(oldest)
+            self.evictions += 1
+    
+    def _remove(self, key: str):
+        value, _ = self._items.pop(key)
+        self._bytes -= self._entry_size(key, value)
+    
+    def put(self, value) -> str:
+        """value رابط واحد أو قائمة روابط؛ يعيد مفتاحاً من 16 خانة hex"""
+        raw = json.dumps(value, ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            # نفس الرابط يعطي نفس المفتاح، والتصادم النادر يُحل بملح متزايد
+            salt = 0
+            while True:
+                key = hashlib.blake2b(f"{salt}:{raw}".encode(), digest_size=8).hexdigest()
+                existing = self._lookup(key, now)
+                if existing is None or existing == value:
+                    break
+                salt += 1
+            
+            expires_at = now + self.ttl
+            self._store(key, value, expires_at)
+            if self.conn:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO urls (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, raw, expires_at)
+                )
+        return key
+    
+    def get(self, key: str):
+        with self._lock:
+            value = self._lookup(key, time.time())
+            if value is not None:
+                self._items.move_to_end(key)
+            return value
+    
+    def purge(self) -> int:
+        now = time.time()
+        with self._lock:
+            expired = [k for k, (_, expires_at) in self._items.items() if expires_at <= now]
+            for key in expired:
+                self._remove(key)
+            if self.conn:
+                self.conn.execute("DELETE FROM urls WHERE expires_at <= ?", (now,))
+        return len(expired)
+    
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "entries": len(self._items),
+                "bytes": self._bytes,
+                "evictions": self.evictions,
+                "persisted": self.conn is not None
+            }
+
+# ==================== فهرس الوسائط المرفوعة ====================
+class MediaIndex:
+    """المعرف الموحد للوسائط ← file_id الذي أعاده تيليجرام، لإعادة إرسالها بلا تحميل"""
+    
+    def __init__(self, db_file: Path = MEDIA_DB):
+        self.conn = sqlite3.connect(str(db_file), isolation_level=None, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS media (
+                media_key TEXT NOT NULL,
+                quality TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                file_id TEXT NOT NULL,
+                title TEXT,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (media_key, quality)
+            )
+        """)
+    
+    def add(self, media_key: str, quality: str, kind: str, file_id: str, title: str = None):
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO media (media_key, quality, kind, file_id, title, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (media_key, quality, kind, file_id, title, time.time())
+            )
+    
+    def lookup(self, media_key: str) -> List[Dict]:
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT * FROM media WHERE media_key = ? ORDER BY updated_at DESC", (media_key,)
+            ).fetchall()
+        return [dict(r) for r in rows]
+
+# ==================== ذاكرة الأخطاء ====================
+class FailureCache:
+    """آخر خطأ لكل وسائط (media_key) بصلاحية قصيرة حسب نوعه، حتى لا يُعاد الاستخراج لرابط فاشل"""
+    
+    # النوع -> (نمط نص الخطأ، الصلاحية بالثواني، دائم؟)، بالترتيب: الأخطاء المؤقتة تُفحص أولاً
+    # لأن رسائل الحظر المؤقت قد تحتوي كلمات مثل login أو unavailable
+    CLASSES = {
+        "transient": (re.compile(
+            r"HTTP Error (403|429|5\d\d)|rate[- ]?limit|too many requests|try again later|"
+            r"timed? ?out|not a bot|temporarily", re.I), 60, False),
+        "too_long": (re.compile(r"الفيديو طويل جداً"), 24 * 3600, True),
+        "too_large": (re.compile(r"الفيديو كبير جداً"), 6 * 3600, True),
+        "private": (re.compile(
+            r"private (video|account|profile)|(video|account|profile) is private|"
+            r"sign in to confirm your age|requested content is not available for your country", re.I), 3600, True),
+        "removed": (re.compile(
+            r"HTTP Error 404|video unavailable|(has been|was) (removed|deleted)|does not exist|"
+            r"(content|post|video|page) (isn't|is not|is no longer) available", re.I), 6 * 3600, True),
+    }
+    # المدة والحجم يختلفان بين الصوت والفيديو والجودات، والخطأ المؤقت قد يخص صيغة واحدة
+    PER_QUALITY = {"transient", "too_long", "too_large"}
+    # أخطاء من البوت نفسه (الطابور والمهلة) لا علاقة لها بالرابط
+    SKIP = ("انتهت مهلة التحميل", "الخدمة مشغولة")
+    
+    def __init__(self, max_size: int = FAILURE_CACHE_MAX):
+        self.max_size = max_size
+        self._items = OrderedDict()  # key -> (error, class, expires_at)
+        self._lock = threading.Lock()
+        self.hits = {name: 0 for name in self.CLASSES}
+        self.misses = 0
+    
+    def classify(self, error: str) -> str:
+        for name, (pattern, _, _) in self.CLASSES.items():
+            if pattern.search(error):
+                return name
+        return "transient"
+    
+    def put(self, media_key: str, quality: str, error: str) -> Optional[str]:
+        if any(s in error for s in self.SKIP):
+            return None
+        failure = self.classify(error)
+        key = f"{media_key}|{quality}" if failure in self.PER_QUALITY else media_key
+        with self._lock:
+            self._items[key] = (error, failure, time.time() + self.CLASSES[failure][1])
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+        return failure
+    
+    def get(self, media_key: str, quality: str) -> Optional[tuple]:
+        """(الخطأ، دائم؟) إن كان الرابط فشل مؤخراً"""
+        now = time.time()
+        with self._lock:
+            for key in (media_key, f"{media_key}|{quality}"):
+                item = self._items.get(key)
+                if item is None:
+                    continue
+                if item[2] <= now:
+                    del self._items[key]
+                    continue
+                self.hits[item[1]] += 1
+                return item[0], self.CLASSES[item[1]][2]
+            self.misses += 1
+        return None
+    
+    def purge(self) -> int:
+        now = time.time()
+        with self._lock:
+            expired = [k for k, item in self._items.items() if item[2] <= now]
+            for key in expired:
+                del self._items[key]
+        return len(expired)
+    
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"entries": len(self._items), "hits": dict(self.hits), "misses": self.misses}
 
 # ==================== محمل الفيديو ====================
 class VideoDownloader:
@@ -201,12 +786,20 @@ class VideoDownloader:
     QUALITIES = {
         "best": {"name": "🚀 أفضل جودة", "format": "best[ext=mp4]/best"},
         "medium": {"name": "📱 720p", "format": "best[height<=720][ext=mp4]/best[height<=720]"},
-        "low": {"name": "📱 480p", "format": "best[height<=480][ext=mp4]/best[height<=480]"}
+        "low": {"name": "📱 480p", "format": "best[height<=480][ext=mp4]/best[height<=480]"},
+        "audio": {"name": "🎧 صوت فقط", "format": "bestaudio[ext=m4a]/bestaudio/best"}
     }
     
-    def __init__(self, download_path: Path):
+    def __init__(self, download_path: Path, staging_path: Optional[Path] = STAGING_DIR):
         self.download_path = download_path
         self.download_path.mkdir(exist_ok=True)
+        self.staging_path = None
+        if staging_path:
+            try:
+                staging_path.mkdir(parents=True, exist_ok=True)
+                self.staging_path = staging_path
+            except OSError as e:
+                logger.warning(f"⚠️ تعذر إنشاء مجلد الذاكرة {staging_path}، سيتم التحميل للقرص: {e}")
     
     def detect_platform(self, url: str) -> tuple:
         url_lower = url.lower()
@@ -220,7 +813,8 @@ class VideoDownloader:
             if platform == "youtube":
                 patterns = [
                     r"(?:youtube\.com\/watch\?v=|youtu\.be\/)([^&\n?#]+)",
-                    r"(?:youtube\.com\/embed\/)([^&\n?#]+)"
+                    r"(?:youtube\.com\/embed\/)([^&\n?#]+)",
+                    r"(?:youtube\.com\/shorts\/)([^&\n?#\/]+)"
                 ]
                 for pattern in patterns:
                     match = re.search(pattern, url)
@@ -230,17 +824,25 @@ class VideoDownloader:
                 match = re.search(r"(?:reel|p)\/([^\/\n?#]+)", url)
                 if match:
                     return match.group(1)
+            elif platform == "tiktok":
+                match = re.search(r"\/video\/(\d+)", url)
+                if match:
+                    return match.group(1)
+            elif platform == "twitter":
+                match = re.search(r"\/status\/(\d+)", url)
+                if match:
+                    return match.group(1)
         except:
             pass
         return hashlib.md5(url.encode()).hexdigest()[:10]
     
-    def get_quality_buttons(self, url_hash: str) -> InlineKeyboardMarkup:
+    def get_quality_buttons(self, url_hash: str, prefix: str = "dl") -> InlineKeyboardMarkup:
         buttons = []
         row = []
         for i, (qid, qinfo) in enumerate(self.QUALITIES.items()):
             row.append(InlineKeyboardButton(
                 qinfo["name"],
-                callback_data=f"dl_{qid}_{url_hash}"
+                callback_data=f"{prefix}_{qid}_{url_hash}"
             ))
             if len(row) == 2:
                 buttons.append(row)
@@ -250,14 +852,70 @@ class VideoDownloader:
         buttons.append([InlineKeyboardButton("❌ إلغاء", callback_data="cancel")])
         return InlineKeyboardMarkup(buttons)
     
-    def download(self, url: str, quality: str) -> tuple:
+    def media_key(self, url: str) -> str:
+        # معرف موحد للوسائط بغض النظر عن شكل الرابط
+        platform_id, _ = self.detect_platform(url)
+        return f"{platform_id}:{self.extract_video_id(url, platform_id)}"
+    
+    def output_name(self, url: str) -> str:
+        platform_id, _ = self.detect_platform(url)
+        return f"video_{self.extract_video_id(url, platform_id)}_{int(time.time())}"
+    
+    @staticmethod
+    def estimated_size(info: Dict) -> int:
+        # الحجم الذي يعلنه yt-dlp قبل التحميل (0 إن لم يكن معروفاً)
+        formats = info.get('requested_formats') or [info]
+        sizes = [f.get('filesize') or f.get('filesize_approx') for f in formats]
+        if not all(sizes):
+            return 0
+        return int(sum(sizes))
+    
+    def _reserve_staging(self, name: str, info: Dict) -> bool:
+        """حجز مساحة في الذاكرة قبل التحميل، فلا تملأ التحميلات المتزامنة tmpfs معاً"""
+        size = self.estimated_size(info)
+        if not self.staging_path or not 0 < size <= STAGING_MAX_MB * 1024 * 1024:
+            return False
+        # أجزاء التحميل + ملف الدمج + نسخة faststart قد تتواجد معاً
+        needed = size * 3
+        try:
+            import fcntl
+            
+            # الحجوزات ملفات داخل مجلد الذاكرة ليراها كل العمال، والقفل يجعل الفحص والحجز خطوة واحدة
+            with open(STAGING_LOCK, 'w') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                reserved = sum(int(f.read_text() or 0) for f in self.staging_path.glob("*.reserve"))
+                if shutil.disk_usage(self.staging_path).free - reserved < needed:
+                    return False
+                (self.staging_path / f"{name}.reserve").write_text(str(needed))
+            return True
+        except (OSError, ValueError, ImportError) as e:
+            logger.warning(f"⚠️ تعذر حجز مساحة في الذاكرة: {e}")
+            return False
+    
+    def _release_staging(self, name: str):
+        try:
+            (self.staging_path / f"{name}.reserve").unlink()
+        except:
+            pass
+    
+    @staticmethod
+    def _is_out_of_space(e: BaseException) -> bool:
+        # yt-dlp يغلف OSError داخل DownloadError
+        while e is not None:
+            if isinstance(e, OSError) and e.errno == errno.ENOSPC:
+                return True
+            exc_info = getattr(e, 'exc_info', None)
+            e = e.__cause__ or e.__context__ or (exc_info[1] if exc_info else None)
+        return False
+    
+    def download(self, url: str, quality: str, filename: str = None) -> tuple:
         info = None
         qconfig = self.QUALITIES.get(quality, self.QUALITIES["best"])
         platform_id, platform_name = self.detect_platform(url)
         video_id = self.extract_video_id(url, platform_id)
         
-        timestamp = int(time.time())
-        safe_filename = f"video_{video_id}_{timestamp}"
+        # اسم ثابت يسمح لـ continuedl باستكمال ملف .part بعد إعادة التشغيل
+        safe_filename = filename or self.output_name(url)
         output_template = str(self.download_path / f"{safe_filename}.%(ext)s")
         
         # تحسين صياغة الجودة لتكون أكثر مرونة
@@ -265,6 +923,8 @@ class VideoDownloader:
             format_str = "bestvideo[ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]/best"
         elif quality == "medium":
             format_str = "bestvideo[height<=720][ext=mp4]+bestaudio[ext=m4a]/best[height<=720][ext=mp4]/best[height<=720]"
+        elif quality == "audio":
+            format_str = qconfig["format"]
         else:
             format_str = "bestvideo[height<=480][ext=mp4]+bestaudio[ext=m4a]/best[height<=480][ext=mp4]/best[height<=480]"
 
@@ -283,7 +943,7 @@ class VideoDownloader:
             'geo_bypass': True,
             'no_check_certificate': True,
             'nocheckcertificate': True,
-            'logger': logger,
+            'logger': YtDlpLogger(platform=platform_id, stage="download"),
             'headers': {
                 'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36',
                 'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7',
@@ -295,7 +955,19 @@ class VideoDownloader:
             }
         }
         
+        is_audio = quality == "audio"
+        fallback_format = 'bestaudio/best' if is_audio else 'best'
+        if is_audio:
+            # مسار الصوت فقط: لا دمج فيديو، ونسخ AAC كما هو إلى m4a (التحويل فقط إن لزم)
+            del ydl_opts['merge_output_format']
+            ydl_opts['postprocessors'] = [{'key': 'FFmpegExtractAudio', 'preferredcodec': 'm4a'}]
+            ffmpeg_path = shutil.which(FFMPEG_BIN)
+            if ffmpeg_path:
+                ydl_opts['ffmpeg_location'] = ffmpeg_path
+        
         try:
+            import yt_dlp
+            
             with yt_dlp.YoutubeDL(ydl_opts) as ydl:
                 # محاولة استخراج المعلومات مع تحسينات للانستغرام
                 try:
@@ -303,7 +975,7 @@ class VideoDownloader:
                 except Exception as e:
                     logger.warning(f"محاولة استخراج أولى فشلت: {e}")
                     # محاولة ثانية بوضعية أقل صرامة وUA مختلف
-                    ydl_opts['format'] = 'best'
+                    ydl_opts['format'] = fallback_format
                     if platform_id == 'instagram':
                         # تجربة تبديل الرابط لرابط الـ ddinstagram كحل احتياطي
                         # إزالة www. لأنها تسبب مشاكل DNS مع ddinstagram
@@ -334,29 +1006,72 @@ class VideoDownloader:
                     return None, "❌ لا يمكن قراءة معلومات الفيديو"
                 
                 duration = info.get('duration') or 0
-                if duration > MAX_DURATION:
+                if duration > (MAX_AUDIO_DURATION if is_audio else MAX_DURATION):
                     minutes = duration // 60
                     return None, f"❌ الفيديو طويل جداً ({minutes} دقيقة)"
                 
-                # التحميل الفعلي
+                # التحميل الفعلي، والمسار النهائي يأتي من yt-dlp بعد الدمج والتحويل بدل البحث في المجلد
+                staged = self._reserve_staging(safe_filename, info)
+                target_dir = self.staging_path if staged else self.download_path
+                reported = []
+                ydl_opts['outtmpl'] = str(target_dir / f"{safe_filename}.%(ext)s")
+                ydl_opts['post_hooks'] = [reported.append]
+                started = time.monotonic()
                 try:
-                    ydl.download([url])
+                    with yt_dlp.YoutubeDL(ydl_opts) as ydl_dl:
+                        ydl_dl.download([url])
                 except Exception as e:
+                    if staged and self._is_out_of_space(e):
+                        # امتلأت الذاكرة رغم الحجز (تقدير الحجم غير دقيق): نعيد التحميل إلى القرص
+                        logger.warning(f"⚠️ امتلأ مجلد الذاكرة أثناء تحميل {safe_filename}، إعادة المحاولة على القرص")
+                        for f in self.staging_path.glob(f"{safe_filename}.*"):
+                            if f.suffix != '.reserve':
+                                try:
+                                    f.unlink()
+                                except:
+                                    pass
+                        self._release_staging(safe_filename)
+                        staged = False
+                        target_dir = self.download_path
+                        reported.clear()
+                        ydl_opts['outtmpl'] = str(target_dir / f"{safe_filename}.%(ext)s")
+                        with yt_dlp.YoutubeDL(ydl_opts) as ydl_disk:
+                            ydl_disk.download([url])
                     # إذا فشل التحميل بسبب "الملف فارغ"، نحاول بجودة 'best' مباشرة كحل أخير
-                    if "empty" in str(e).lower():
+                    elif "empty" in str(e).lower():
                         logger.warning("محاولة التحميل بوضعية الاحتياط (fallback best)")
-                        ydl_opts['format'] = 'best'
+                        ydl_opts['format'] = fallback_format
                         with yt_dlp.YoutubeDL(ydl_opts) as ydl_retry:
                             ydl_retry.download([url])
                     else:
                         raise e
+                finally:
+                    if staged:
+                        self._release_staging(safe_filename)
                 
-                files = list(self.download_path.glob(f"{safe_filename}.*"))
-                if not files:
-                    return None, "❌ لم يتم العثور على الملف بعد التحميل"
+                if reported and Path(reported[-1]).exists():
+                    file_path = Path(reported[-1])
+                else:
+                    files = [
+                        f for f in target_dir.glob(f"{safe_filename}.*")
+                        if not f.name.endswith(('.part', '.ytdl', '.thumb.jpg', '.reserve'))
+                    ]
+                    if not files:
+                        return None, "❌ لم يتم العثور على الملف بعد التحميل"
+                    file_path = files[0]
                 
-                file_path = files[0]
                 file_size = file_path.stat().st_size
+                logger.info(
+                    f"تحميل {file_path.name} إلى {'الذاكرة' if staged else 'القرص'}: "
+                    f"{time.monotonic() - started:.2f} ثانية",
+                    extra={
+                        "platform": platform_id,
+                        "stage": "download",
+                        "elapsed": time.monotonic() - started,
+                        "size_mb": file_size / (1024 * 1024),
+                        "staged": staged
+                    }
+                )
                 
                 # التحقق من أن الملف ليس فارغاً
                 if file_size == 0:
@@ -380,7 +1095,8 @@ class VideoDownloader:
                     "size": size_mb,
                     "size_bytes": file_size,
                     "platform": platform_name,
-                    "uploader": info.get('uploader') or 'غير معروف'
+                    "uploader": info.get('uploader') or 'غير معروف',
+                    "kind": "audio" if is_audio else "video"
                 }
                 
                 return file_path, video_info
@@ -392,20 +1108,706 @@ class VideoDownloader:
                 return None, "❌ فشل التحميل: الخادم أرسل ملفاً فارغاً. جرب رابطاً آخر."
             return None, f"❌ حدث خطأ: {error_msg[:100]}"
 
+# ==================== المعالجة اللاحقة ====================
+class MediaPostProcessor:
+    """تجهيز الفيديو للتشغيل الفوري: faststart + صورة مصغرة + أبعاد ومدة"""
+
+    FASTSTART_EXTS = {".mp4", ".m4v", ".mov", ".m4a"}
+    THUMB_SIZE = 320  # حد تيليجرام للصورة المصغرة
+
+    def __init__(self, ffmpeg: str = FFMPEG_BIN, ffprobe: str = FFPROBE_BIN):
+        self.ffmpeg = shutil.which(ffmpeg)
+        self.ffprobe = shutil.which(ffprobe)
+        if not self.ffmpeg:
+            logger.warning("⚠️ ffmpeg غير موجود، سيتم تخطي المعالجة اللاحقة")
+
+    def _run(self, cmd: List[str]) -> subprocess.CompletedProcess:
+        return subprocess.run(
+            cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            timeout=POSTPROCESS_TIMEOUT,
+            check=True
+        )
+
+    def faststart(self, file_path: Path) -> bool:
+        # نقل moov لبداية الملف بدون إعادة ترميز (نسخ المسارات فقط)
+        if not self.ffmpeg or file_path.suffix.lower() not in self.FASTSTART_EXTS:
+            return False
+        tmp_path = file_path.with_name(f"{file_path.stem}.faststart{file_path.suffix}")
+        try:
+            self._run([
+                self.ffmpeg, '-y', '-v', 'error', '-i', str(file_path),
+                '-map', '0', '-c', 'copy', '-movflags', '+faststart', str(tmp_path)
+            ])
+            os.replace(tmp_path, file_path)
+            return True
+        except Exception as e:
+            logger.warning(f"فشل faststart: {e}")
+            try:
+                tmp_path.unlink()
+            except:
+                pass
+            return False
+
+    def probe(self, file_path: Path) -> Dict:
+        if not self.ffprobe:
+            return {}
+        try:
+            result = self._run([
+                self.ffprobe, '-v', 'error', '-select_streams', 'v:0',
+                '-show_entries', 'stream=width,height:format=duration',
+                '-of', 'json', str(file_path)
+            ])
+            data = json.loads(result.stdout or b'{}')
+        except Exception as e:
+            logger.warning(f"فشل ffprobe: {e}")
+            return {}
+
+        meta = {}
+        streams = data.get('streams') or []
+        if streams:
+            meta['width'] = int(streams[0].get('width') or 0) or None
+            meta['height'] = int(streams[0].get('height') or 0) or None
+        try:
+            meta['duration'] = int(float(data.get('format', {}).get('duration')))
+        except (TypeError, ValueError):
+            pass
+        return {k: v for k, v in meta.items() if v}
+
+    def thumbnail(self, file_path: Path, duration: int = 0) -> Optional[Path]:
+        if not self.ffmpeg:
+            return None
+        thumb_path = file_path.with_name(f"{file_path.stem}.thumb.jpg")
+        # نأخذ لقطة من الثانية الأولى (أو منتصف المقاطع القصيرة جداً)
+        seek = min(1.0, duration / 2) if duration else 0
+        size = self.THUMB_SIZE
+        scale = f"scale='if(gt(iw,ih),{size},-2)':'if(gt(iw,ih),-2,{size})'"
+        try:
+            self._run([
+                self.ffmpeg, '-y', '-v', 'error', '-ss', f"{seek:.2f}", '-i', str(file_path),
+                '-frames:v', '1', '-vf', scale, '-q:v', '5', str(thumb_path)
+            ])
+        except Exception as e:
+            logger.warning(f"فشل إنشاء الصورة المصغرة: {e}")
+            return None
+        return thumb_path if thumb_path.exists() and thumb_path.stat().st_size > 0 else None
+
+    def process(self, file_path: Path, info: Dict) -> Dict:
+        """يعدل info في مكانه ويضيف width/height/thumb ومدة المعالجة"""
+        started = time.monotonic()
+
+        if self.faststart(file_path):
+            info['size_bytes'] = file_path.stat().st_size
+            info['size'] = info['size_bytes'] / (1024 * 1024)
+
+        meta = self.probe(file_path)
+        info['width'] = meta.get('width')
+        info['height'] = meta.get('height')
+        if meta.get('duration'):
+            info['duration'] = meta['duration']
+        is_audio = info.get('kind') == 'audio'
+        info['thumb'] = None if is_audio else self.thumbnail(file_path, info.get('duration') or 0)
+
+        info['postprocess_seconds'] = time.monotonic() - started
+        logger.info(
+            f"المعالجة اللاحقة لـ {file_path.name}: {info['postprocess_seconds']:.2f} ثانية",
+            extra={"stage": "postprocess", "elapsed": info['postprocess_seconds']}
+        )
+        return info
+
+    @staticmethod
+    def video_kwargs(info: Dict) -> Dict:
+        # معاملات send_video/reply_video المعروفة فقط
+        return {k: info[k] for k in ('width', 'height', 'duration') if info.get(k)}
+    
+    @staticmethod
+    def audio_kwargs(info: Dict) -> Dict:
+        kwargs = {'title': info.get('title'), 'performer': info.get('uploader'), 'duration': info.get('duration')}
+        return {k: v for k, v in kwargs.items() if v}
+
+# ==================== الرفع المتدفق ====================
+class MultipartStream:
+    """جسم multipart/form-data يُقرأ من القرص على دفعات ثابتة الحجم"""
+
+    def __init__(self, fields: Dict[str, Any], files: Dict[str, Path], chunk_size: int = UPLOAD_CHUNK_SIZE):
+        self.boundary = os.urandom(16).hex()
+        self.chunk_size = chunk_size
+        self._parts = []
+
+        for name, value in fields.items():
+            if value is None:
+                continue
+            if isinstance(value, bool):
+                value = "true" if value else "false"
+            self._parts.append(
+                f'--{self.boundary}\r\n'
+                f'Content-Disposition: form-data; name="{name}"\r\n\r\n'
+                f'{value}\r\n'.encode('utf-8')
+            )
+        for name, path in files.items():
+            self._parts.append(
+                f'--{self.boundary}\r\n'
+                f'Content-Disposition: form-data; name="{name}"; filename="{path.name}"\r\n'
+                f'Content-Type: application/octet-stream\r\n\r\n'.encode('utf-8')
+            )
+            self._parts.append(path)
+            self._parts.append(b'\r\n')
+        self._parts.append(f'--{self.boundary}--\r\n'.encode('utf-8'))
+
+    @property
+    def content_type(self) -> str:
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    def __len__(self) -> int:
+        # الطول معروف مسبقاً، فيُرسل Content-Length بدل chunked
+        return sum(p.stat().st_size if isinstance(p, Path) else len(p) for p in self._parts)
+
+    def __iter__(self):
+        for part in self._parts:
+            if not isinstance(part, Path):
+                yield part
+                continue
+            with open(part, 'rb') as f:
+                while True:
+                    chunk = f.read(self.chunk_size)
+                    if not chunk:
+                        break
+                    yield chunk
+
+
+class StreamingUploader:
+    """رفع الفيديو إلى Bot API بذاكرة ثابتة بدل قراءة الملف كاملاً كما يفعل InputFile"""
+
+    def __init__(self, token: str):
+        self.api_url = f"{BOT_API_BASE_URL or 'https://api.telegram.org/bot'}{token}"
+
+    def _post(self, method: str, fields: Dict[str, Any], files: Dict[str, Path], timeout: int):
+        import requests
+
+        body = MultipartStream(fields, files)
+        started = time.monotonic()
+        response = requests.post(
+            f"{self.api_url}/{method}",
+            data=body,
+            headers={'Content-Type': body.content_type},
+            timeout=(30, timeout)
+        )
+        try:
+            result = response.json()
+        except ValueError:
+            result = {}
+        if not result.get('ok'):
+            raise TelegramError(result.get('description') or f"HTTP {response.status_code}")
+
+        elapsed = time.monotonic() - started
+        size_mb = len(body) / (1024 * 1024)
+        logger.info(
+            f"رفع متدفق {method}: {size_mb:.1f} MB "
+            f"في {elapsed:.1f} ثانية (RSS الحالي {self.current_rss_mb():.0f} MB)",
+            extra={"stage": "upload", "elapsed": elapsed, "size_mb": size_mb}
+        )
+        return result['result']
+
+    def send_video(self, chat_id, file_path: Path, thumb_path: Optional[Path] = None,
+                   timeout: int = 300, **params) -> Dict:
+        files = {'video': file_path}
+        if thumb_path:
+            files['thumb'] = thumb_path
+        return self._post('sendVideo', {'chat_id': chat_id, **params}, files, timeout)
+
+    def send_audio(self, chat_id, file_path: Path, thumb_path: Optional[Path] = None,
+                   timeout: int = 300, **params) -> Dict:
+        files = {'audio': file_path}
+        if thumb_path:
+            files['thumb'] = thumb_path
+        return self._post('sendAudio', {'chat_id': chat_id, **params}, files, timeout)
+
+    def send_media_group(self, chat_id, items: List[Dict], timeout: int = 300) -> List[Dict]:
+        """items: قائمة من {"type", "path", "thumb", "params"} (من 2 إلى 10 عناصر من نفس النوع)"""
+        media, files = [], {}
+        for i, item in enumerate(items):
+            if item.get('type') == 'audio':
+                entry = {'type': 'audio', 'media': f'attach://video{i}'}
+            else:
+                entry = {'type': 'video', 'media': f'attach://video{i}', 'supports_streaming': True}
+            files[f'video{i}'] = item['path']
+            if item.get('thumb'):
+                files[f'thumb{i}'] = item['thumb']
+                entry['thumb'] = f'attach://thumb{i}'
+            entry.update(item.get('params', {}))
+            media.append(entry)
+        fields = {'chat_id': chat_id, 'media': json.dumps(media, ensure_ascii=False)}
+        return self._post('sendMediaGroup', fields, files, timeout)
+
+    @staticmethod
+    def current_rss_mb() -> float:
+        # ru_maxrss قيمة قصوى طوال عمر العملية، فنقرأ الذاكرة الحالية من /proc
+        try:
+            with open('/proc/self/statm') as f:
+                return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+        except Exception:
+            return 0.0
+
+# ==================== جدولة التحميلات ====================
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+    
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    def take(self, n: int = 1) -> float:
+        """يعيد 0 عند القبول، وإلا عدد الثواني حتى تتوفر n رموز"""
+        self._refill()
+        if self.tokens >= n:
+            self.tokens -= n
+            return 0.0
+        return (n - self.tokens) / self.rate
+    
+    def available(self) -> float:
+        """الرموز المتوفرة الآن دون استهلاكها"""
+        self._refill()
+        return self.tokens
+    
+    def is_full(self) -> bool:
+        self._refill()
+        return self.tokens >= self.capacity
+
+
+class FairScheduler:
+    """قبول الطلبات بحدود لكل مستخدم، ثم توزيعها على العمال بالتناوب بين المستخدمين"""
+    
+    MAX_BUCKETS = 10000
+    
+    def __init__(self, workers: int = DOWNLOAD_WORKERS, rate_per_minute: float = RATE_LIMIT_PER_MINUTE,
+                 burst: int = RATE_LIMIT_BURST, max_per_user: int = MAX_JOBS_PER_USER, priority_users=(ADMIN_ID,)):
+        self.rate = rate_per_minute / 60
+        self.burst = burst
+        self.max_per_user = max_per_user
+        self.priority_users = set(priority_users)
+        
+        self._cond = threading.Condition()
+        self._queues = OrderedDict()  # user_id -> deque من المهام، بترتيب الدور
+        self._buckets = {}
+        self._active = {}  # user_id -> عدد المهام المنتظرة والجارية
+        self._running_by_user = {}  # user_id -> عدد المهام الجارية فعلاً
+        self._pending = 0
+        self._running = 0
+        self.metrics = {
+            "accepted": 0,
+            "throttled_rate": 0,
+            "throttled_concurrency": 0,
+            "completed": 0,
+            "failed": 0,
+        }
+        
+        for i in range(max(1, workers)):
+            threading.Thread(target=self._worker, name=f"download-worker-{i}", daemon=True).start()
+    
+    def submit(self, user_id: int, fn, *args, admit: bool = True) -> tuple:
+        """يعيد (مقبول، ثواني الانتظار، الترتيب في الطابور)"""
+        return self.submit_many(user_id, [(fn, args)], admit=admit)
+    
+    def submit_many(self, user_id: int, tasks: List[tuple], admit: bool = True) -> tuple:
+        """عدة مهام (fn، args) تُقبل معاً برمز لكل مهمة، ثم تُجدول كل منها منفردة"""
+        with self._cond:
+            if admit and user_id not in self.priority_users:
+                if self._active.get(user_id, 0) >= self.max_per_user:
+                    self.metrics["throttled_concurrency"] += 1
+                    return False, 0, 0
+                
+                bucket = self._buckets.get(user_id)
+                if bucket is None:
+                    if len(self._buckets) >= self.MAX_BUCKETS:
+                        self._prune_buckets()
+                    bucket = self._buckets[user_id] = TokenBucket(self.rate, self.burst)
+                wait = bucket.take(len(tasks))
+                if wait:
+                    self.metrics["throttled_rate"] += 1
+                    return False, wait, 0
+            
+            queue = self._queues.setdefault(user_id, deque())
+            queue.extend(tasks)
+            self._active[user_id] = self._active.get(user_id, 0) + len(tasks)
+            self._pending += len(tasks)
+            self.metrics["accepted"] += len(tasks)
+            self._cond.notify_all()
+            return True, 0, self._position(user_id, len(queue) - len(tasks))
+    
+    def capacity(self, user_id: int, n: int) -> tuple:
+        """يعيد (كم مهمة من n تُقبل الآن، ثواني الانتظار حتى يُقبل الباقي) دون استهلاك رموز"""
+        if user_id in self.priority_users:
+            return n, 0.0
+        with self._cond:
+            bucket = self._buckets.get(user_id)
+            tokens = bucket.available() if bucket else self.burst
+        admitted = min(n, int(tokens))
+        if admitted == n:
+            return n, 0.0
+        # الباقي يُقبل حين تتوفر رموزه بعد استهلاك المقبول، ولا يتجاوز سعة الدلو
+        needed = min(n, admitted + self.burst)
+        return admitted, (needed - tokens) / self.rate
+    
+    def _position(self, user_id: int, rounds: int) -> int:
+        # ترتيب مهمة المستخدم رقم rounds في طابوره حسب التناوب: مهمة لكل مستخدم في كل جولة، ومهام المشرف أولاً
+        position = 0
+        ahead = True
+        for uid, queue in self._queues.items():
+            if uid == user_id:
+                ahead = False
+                position += rounds + 1
+            elif uid in self.priority_users:
+                position += len(queue)
+            elif user_id not in self.priority_users:
+                position += min(len(queue), rounds + 1 if ahead else rounds)
+        return position
+    
+    def _prune_buckets(self):
+        # الدلاء الممتلئة تعادل مستخدماً جديداً، فلا داعي للاحتفاظ بها
+        for user_id in [uid for uid, b in self._buckets.items() if b.is_full()]:
+            del self._buckets[user_id]
+    
+    def _next_job(self) -> tuple:
+        for user_id in self.priority_users:
+            if user_id in self._queues:
+                self._queues.move_to_end(user_id, last=False)
+                break
+        # أول مستخدم بالدور لم يبلغ حد المهام الجارية، حتى لا تشغل دفعة واحدة كل العمال
+        for user_id, queue in self._queues.items():
+            if user_id in self.priority_users or self._running_by_user.get(user_id, 0) < self.max_per_user:
+                job = queue.popleft()
+                if queue:
+                    self._queues.move_to_end(user_id)
+                else:
+                    del self._queues[user_id]
+                return user_id, job
+        return None, None
+    
+    def _worker(self):
+        while True:
+            with self._cond:
+                while True:
+                    user_id, job = self._next_job() if self._pending else (None, None)
+                    if job:
+                        break
+                    self._cond.wait()
+                fn, args = job
+                self._pending -= 1
+                self._running += 1
+                self._running_by_user[user_id] = self._running_by_user.get(user_id, 0) + 1
+            
+            ok = True
+            try:
+                fn(*args)
+            except Exception as e:
+                ok = False
+                logger.error(f"خطأ في مهمة التحميل للمستخدم {user_id}: {e}")
+            finally:
+                with self._cond:
+                    self._running -= 1
+                    self.metrics["completed" if ok else "failed"] += 1
+                    self._active[user_id] -= 1
+                    if self._active[user_id] <= 0:
+                        del self._active[user_id]
+                    self._running_by_user[user_id] -= 1
+                    if self._running_by_user[user_id] <= 0:
+                        del self._running_by_user[user_id]
+                    # مهام مستخدم كان عند حده أصبحت قابلة للتشغيل
+                    self._cond.notify_all()
+    
+    def stats(self) -> Dict:
+        with self._cond:
+            return {**self.metrics, "queued": self._pending, "running": self._running}
+
+# ==================== طابور المهام ====================
+class JobQueue:
+    """طابور تحميل دائم في SQLite يتشاركه البوت وعمليات العمال (وحتى أجهزة أخرى على نفس المجلد)"""
+    
+    def __init__(self, db_file: Path = JOBS_DB):
+        self.conn = sqlite3.connect(str(db_file), timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                url TEXT NOT NULL,
+                quality TEXT NOT NULL,
+                filename TEXT,
+                status TEXT NOT NULL DEFAULT 'queued',
+                worker TEXT,
+                file_path TEXT,
+                info TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, id)")
+    
+    def enqueue(self, url: str, quality: str, filename: str = None) -> int:
+        now = time.time()
+        with self._lock:
+            cur = self.conn.execute(
+                "INSERT INTO jobs (url, quality, filename, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (url, quality, filename, now, now)
+            )
+            return cur.lastrowid
+    
+    def claim(self, worker_id: str) -> Optional[Dict]:
+        # BEGIN IMMEDIATE يمنع عاملين من أخذ نفس المهمة
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.conn.execute(
+                    "SELECT * FROM jobs WHERE status = 'queued' ORDER BY id LIMIT 1"
+                ).fetchone()
+                if row:
+                    self.conn.execute(
+                        "UPDATE jobs SET status = 'running', worker = ?, updated_at = ? WHERE id = ?",
+                        (worker_id, time.time(), row['id'])
+                    )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return dict(row) if row else None
+    
+    def complete(self, job_id: int, file_path: Path, info: Dict) -> bool:
+        """False إذا أُلغيت المهمة أثناء التحميل، وعندها يحذف العامل ملفاتها"""
+        info = {k: str(v) if isinstance(v, Path) else v for k, v in info.items()}
+        with self._lock:
+            updated = self.conn.execute(
+                "UPDATE jobs SET status = 'done', file_path = ?, info = ?, updated_at = ? "
+                "WHERE id = ? AND status = 'running'",
+                (str(file_path), json.dumps(info, ensure_ascii=False), time.time(), job_id)
+            ).rowcount
+            if not updated:
+                self.conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+        return bool(updated)
+    
+    def fail(self, job_id: int, error: str):
+        with self._lock:
+            updated = self.conn.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, updated_at = ? WHERE id = ? AND status = 'running'",
+                (error, time.time(), job_id)
+            ).rowcount
+            if not updated:
+                self.conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+    
+    def cancel(self, job_id: int):
+        # المهمة المنتظرة تُحذف، والجارية تُعلّم ليتخلص العامل من نتيجتها
+        with self._lock:
+            self.conn.execute("DELETE FROM jobs WHERE id = ? AND status IN ('queued', 'done', 'failed')", (job_id,))
+            self.conn.execute(
+                "UPDATE jobs SET status = 'cancelled', updated_at = ? WHERE id = ? AND status = 'running'",
+                (time.time(), job_id)
+            )
+    
+    def fail_worker(self, worker_id: str, error: str) -> int:
+        """مهام عامل توقف: الجارية تفشل فوراً بدل أن ينتظرها البوت حتى المهلة"""
+        with self._lock:
+            self.conn.execute("DELETE FROM jobs WHERE worker = ? AND status = 'cancelled'", (worker_id,))
+            return self.conn.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, updated_at = ? WHERE worker = ? AND status = 'running'",
+                (error, time.time(), worker_id)
+            ).rowcount
+    
+    def is_cancelled(self, job_id: int) -> bool:
+        with self._lock:
+            row = self.conn.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return row is None or row['status'] == 'cancelled'
+    
+    def wait(self, job_id: int, timeout: float = DOWNLOAD_TIMEOUT + POSTPROCESS_TIMEOUT,
+             queue_timeout: float = JOB_QUEUE_TIMEOUT) -> tuple:
+        """ينتظر نتيجة المهمة ويعيدها بنفس شكل VideoDownloader.download"""
+        # مهلة التحميل تبدأ عندما يأخذ عامل المهمة، لا من لحظة إضافتها للطابور
+        deadline = time.monotonic() + queue_timeout
+        claimed = False
+        while time.monotonic() < deadline:
+            with self._lock:
+                row = self.conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None, "❌ فشل التحميل"
+            if row['status'] == 'running' and not claimed:
+                claimed = True
+                deadline = time.monotonic() + timeout
+            if row['status'] in ('done', 'failed'):
+                with self._lock:
+                    self.conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+                if row['status'] == 'failed':
+                    return None, row['error'] or "❌ فشل التحميل"
+                info = json.loads(row['info'])
+                if info.get('thumb'):
+                    info['thumb'] = Path(info['thumb'])
+                return Path(row['file_path']), info
+            time.sleep(JOB_POLL_INTERVAL)
+        
+        self.cancel(job_id)
+        if not claimed:
+            return None, "❌ الخدمة مشغولة حالياً، حاول مرة أخرى لاحقاً"
+        return None, "❌ انتهت مهلة التحميل"
+    
+    def clear(self) -> int:
+        # لا أحد ينتظر هذه المهام بعد إعادة تشغيل البوت، وسجل المهام يعيد إضافتها
+        with self._lock:
+            return self.conn.execute("DELETE FROM jobs").rowcount
+
+
+def run_download_worker(worker_id: str, staging_path: Optional[Path] = STAGING_DIR):
+    """حلقة عامل التحميل: تعمل في عملية مستقلة وتكتب النتيجة في الطابور ليرفعها البوت"""
+    if multiprocessing.parent_process() is not None:
+        # عملية spawn جديدة لا ترث إعداد التسجيل، ولكل عامل ملف مستقل كي لا تتعارض عمليات التدوير
+        setup_runtime(f"worker-{worker_id}")
+    jobs = JobQueue()
+    downloader = VideoDownloader(VIDEOS_DIR, staging_path)
+    postprocessor = MediaPostProcessor()
+    logger.info(f"👷 بدء عامل التحميل {worker_id}", extra={"worker": worker_id})
+    
+    while True:
+        job = jobs.claim(worker_id)
+        if not job:
+            time.sleep(JOB_POLL_INTERVAL)
+            continue
+        
+        try:
+            file_path, info = downloader.download(job['url'], job['quality'], job['filename'])
+            if file_path is None:
+                jobs.fail(job['id'], info)
+                continue
+            # البوت توقف عن الانتظار، فلا داعي للمعالجة ولا لإبقاء الملف
+            if not jobs.is_cancelled(job['id']):
+                postprocessor.process(file_path, info)
+            if not jobs.complete(job['id'], file_path, info):
+                logger.info(f"المهمة {job['id']} أُلغيت، حذف ملفاتها", extra={"worker": worker_id, "job_id": job['id']})
+                for path in (file_path, info.get('thumb')):
+                    if path:
+                        try:
+                            Path(path).unlink()
+                        except:
+                            pass
+        except Exception as e:
+            logger.error(f"خطأ في العامل {worker_id}: {e}")
+            jobs.fail(job['id'], f"❌ حدث خطأ: {str(e)[:100]}")
+
+# ==================== سجل المهام ====================
+class JobJournal:
+    """سجل دائم للطلبات المقبولة ومرحلتها، لاستئنافها بعد إعادة تشغيل الحاوية"""
+    
+    def __init__(self, db_file: Path = JOURNAL_DB):
+        self.conn = sqlite3.connect(str(db_file), isolation_level=None, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS journal (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                first_name TEXT,
+                chat_id INTEGER NOT NULL,
+                message_id INTEGER NOT NULL,
+                url TEXT NOT NULL,
+                quality TEXT NOT NULL,
+                filename TEXT NOT NULL,
+                urls TEXT,
+                stage TEXT NOT NULL DEFAULT 'queued',
+                file_path TEXT,
+                info TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+    
+    def add(self, user_id: int, first_name: str, chat_id: int, message_id: int,
+            url: str, quality: str, filename: str, urls: List[str] = None) -> Dict:
+        """urls تُملأ لطلبات الدفعات فقط"""
+        now = time.time()
+        with self._lock:
+            cur = self.conn.execute(
+                "INSERT INTO journal (user_id, first_name, chat_id, message_id, url, quality, filename, urls, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (user_id, first_name, chat_id, message_id, url, quality, filename,
+                 json.dumps(urls) if urls else None, now, now)
+            )
+            row = self.conn.execute("SELECT * FROM journal WHERE id = ?", (cur.lastrowid,)).fetchone()
+        return self._to_job(row)
+    
+    def update(self, job_id: int, stage: str, file_path: Path = None, info: Dict = None):
+        with self._lock:
+            if info is None:
+                self.conn.execute(
+                    "UPDATE journal SET stage = ?, updated_at = ? WHERE id = ?",
+                    (stage, time.time(), job_id)
+                )
+            else:
+                info = {k: str(v) if isinstance(v, Path) else v for k, v in info.items()}
+                self.conn.execute(
+                    "UPDATE journal SET stage = ?, file_path = ?, info = ?, updated_at = ? WHERE id = ?",
+                    (stage, str(file_path), json.dumps(info, ensure_ascii=False), time.time(), job_id)
+                )
+    
+    def remove(self, job_id: int):
+        with self._lock:
+            self.conn.execute("DELETE FROM journal WHERE id = ?", (job_id,))
+    
+    def pending(self) -> List[Dict]:
+        with self._lock:
+            rows = self.conn.execute("SELECT * FROM journal ORDER BY id").fetchall()
+        return [self._to_job(r) for r in rows]
+    
+    def active_filenames(self) -> set:
+        with self._lock:
+            return {r[0] for r in self.conn.execute("SELECT filename FROM journal")}
+    
+    @staticmethod
+    def _to_job(row) -> Dict:
+        job = dict(row)
+        if job.get('urls'):
+            job['urls'] = json.loads(job['urls'])
+        if job.get('file_path'):
+            job['file_path'] = Path(job['file_path'])
+        if job.get('info'):
+            job['info'] = json.loads(job['info'])
+            if job['info'].get('thumb'):
+                job['info']['thumb'] = Path(job['info']['thumb'])
+        return job
+
 # ==================== البوت الرئيسي ====================
 class VideoBot:
     def __init__(self, token: str):
         self.token = token
+        self._first_update_at = None
         self.db = Database()
         self.logger = MessageLogger()
         self.downloader = VideoDownloader(VIDEOS_DIR)
+        self.postprocessor = MediaPostProcessor()
+        self.uploader = StreamingUploader(token)
+        self.jobs = self._start_workers(WORKER_PROCESSES)
+        self.scheduler = FairScheduler()
+        self.journal = JobJournal()
+        self.urls = UrlRegistry()
+        self.media_index = MediaIndex()
+        self.failures = FailureCache()
         
         if not token:
             logger.error("❌ TOKEN is missing! Please check your .env file or environment variables.")
             raise ValueError("TOKEN cannot be None. Make sure 'TOKEN' is set in your environment.")
             
         try:
-            self.updater = Updater(token, use_context=True)
+            updater_kwargs = {}
+            if LOCAL_BOT_API:
+                updater_kwargs['base_url'] = BOT_API_BASE_URL
+                if BOT_API_BASE_FILE_URL:
+                    updater_kwargs['base_file_url'] = BOT_API_BASE_FILE_URL
+                logger.info(f"🖥️ استخدام خادم Bot API محلي: {BOT_API_BASE_URL}")
+            self.updater = Updater(token, use_context=True, **updater_kwargs)
             self.dp = self.updater.dispatcher
         except Exception as e:
             logger.error(f"فشل في بدء Updater: {e}")
@@ -416,12 +1818,23 @@ class VideoBot:
             raise e
         
         self._add_handlers()
-        self._setup_commands()
+        
+        # تسجيل الأوامر لا يلزم قبل بدء الاستقبال
+        self.updater.job_queue.run_once(self._setup_commands, 0)
         
         # تنظيف الملفات كل ساعة
         self.updater.job_queue.run_repeating(self.cleanup_job, interval=3600, first=10)
+        
+        # مراقبة عمليات العمال
+        if self.jobs:
+            self.updater.job_queue.run_repeating(
+                self.supervise_workers, interval=WORKER_CHECK_INTERVAL, first=WORKER_CHECK_INTERVAL
+            )
+        
+        # استئناف الطلبات التي قطعتها إعادة التشغيل
+        self.updater.job_queue.run_once(self.resume_job, 0)
     
-    def _setup_commands(self):
+    def _setup_commands(self, context: CallbackContext = None):
         commands = [
             ("start", "🚀 بدء"),
             ("help", "❓ مساعدة"),
@@ -438,6 +1851,9 @@ class VideoBot:
             pass
     
     def _add_handlers(self):
+        # قياس زمن الإقلاع حتى أول تحديث
+        self.dp.add_handler(TypeHandler(Update, self._first_update), group=-1)
+        
         # أوامر عامة
         self.dp.add_handler(CommandHandler("start", self.start))
         self.dp.add_handler(CommandHandler("help", self.help))
@@ -451,6 +1867,8 @@ class VideoBot:
         
         # نظام الرد للمشرف
         self.dp.add_handler(CommandHandler("reply", self.admin_reply_command))
+        self.dp.add_handler(CommandHandler("tickets", self.admin_tickets))
+        self.dp.add_handler(CommandHandler("users", self.admin_users_command))
         
         # لوحة تحكم الآدمين
         self.dp.add_handler(CommandHandler("admin", self.admin_panel))
@@ -458,12 +1876,116 @@ class VideoBot:
         # معالج الأزرار
         self.dp.add_handler(CallbackQueryHandler(self.handle_buttons))
         
+        # الوضع المضمن (@bot <رابط>)
+        self.dp.add_handler(InlineQueryHandler(self.handle_inline))
+        
         # معالج النصوص (للروابط)
         self.dp.add_handler(MessageHandler(Filters.text & ~Filters.command, self.handle_text))
         
         # معالج الأخطاء
         self.dp.add_error_handler(self.error_handler)
     
+    def _first_update(self, update: Update, context: CallbackContext):
+        if self._first_update_at is None:
+            self._first_update_at = time.monotonic()
+            logger.info(f"⏱️ أول تحديث بعد {self._first_update_at - _STARTED_AT:.2f} ثانية من الإقلاع")
+    
+    def _start_workers(self, count: int) -> Optional[JobQueue]:
+        if count <= 0:
+            return None
+        jobs = JobQueue()
+        dropped = jobs.clear()
+        if dropped:
+            logger.info(f"🧹 حذف {dropped} مهمة قديمة من الطابور")
+        
+        self._workers = {}
+        for i in range(count):
+            self._spawn_worker(i)
+        logger.info(f"👷 تم تشغيل {count} عملية تحميل")
+        return jobs
+    
+    def _spawn_worker(self, index: int):
+        # spawn بدل fork لأن خيوط البوت قد تكون ممسكة بأقفال وقت النسخ
+        process = multiprocessing.get_context("spawn").Process(
+            target=run_download_worker,
+            args=(f"{socket.gethostname()}-{index}",),
+            name=f"download-worker-{index}",
+            daemon=True
+        )
+        process.start()
+        self._workers[index] = process
+    
+    def supervise_workers(self, context: CallbackContext = None):
+        # عامل توقف (OOM أو خطأ) يُعاد تشغيله، ومهامه الجارية تفشل حتى لا ينتظرها أحد حتى المهلة
+        for index, process in list(self._workers.items()):
+            if process.is_alive():
+                continue
+            worker_id = f"{socket.gethostname()}-{index}"
+            failed = self.jobs.fail_worker(worker_id, "❌ توقف عامل التحميل أثناء المعالجة، حاول مرة أخرى")
+            logger.error(
+                f"💥 توقف عامل التحميل {worker_id} (رمز الخروج {process.exitcode})، "
+                f"{failed} مهمة فاشلة، إعادة التشغيل",
+                extra={"worker": worker_id}
+            )
+            process.join(timeout=1)
+            self._spawn_worker(index)
+    
+    def _cached_failure(self, url: str, quality: str) -> Optional[str]:
+        cached = self.failures.get(self.downloader.media_key(url), quality)
+        if not cached:
+            return None
+        error, permanent = cached
+        if permanent:
+            return error
+        return f"{error}\n\n🔁 فشل هذا الرابط قبل قليل، حاول مرة أخرى بعد دقيقة"
+    
+    def _run_download(self, url: str, quality: str, filename: str = None) -> tuple:
+        cached = self._cached_failure(url, quality)
+        if cached:
+            return None, cached
+        
+        # مع عمليات العمال ينتقل التحميل وffmpeg خارج عملية البوت
+        if self.jobs:
+            result = self.jobs.wait(self.jobs.enqueue(url, quality, filename))
+        else:
+            result = self.downloader.download(url, quality, filename)
+            if isinstance(result, tuple) and len(result) == 2 and result[0] is not None:
+                self.postprocessor.process(*result)
+        
+        if isinstance(result, tuple) and len(result) == 2 and result[0] is None:
+            self.failures.put(self.downloader.media_key(url), quality, str(result[1]))
+        return result
+    
+    def _open_media(self, path: Optional[Path], by_path: bool = True):
+        # مع الخادم المحلي نمرر مسار الملف فقط بدل رفع محتواه
+        if not path:
+            return nullcontext()
+        if LOCAL_BOT_API and by_path:
+            return nullcontext(Path(path).resolve().as_uri())
+        return open(path, 'rb')
+    
+    def _send_video(self, bot, chat_id, file_path: Path, thumb_path: Optional[Path] = None, **kwargs):
+        # الخادم المحلي يقرأ الملف بنفسه، وإلا نرفعه متدفقاً من القرص
+        if LOCAL_BOT_API:
+            with self._open_media(file_path) as f, self._open_media(thumb_path, by_path=False) as t:
+                return bot.send_video(chat_id=chat_id, video=f, thumb=t, **kwargs)
+        return self.uploader.send_video(chat_id, file_path, thumb_path, **kwargs)
+    
+    def _send_audio(self, bot, chat_id, file_path: Path, thumb_path: Optional[Path] = None, **kwargs):
+        if LOCAL_BOT_API:
+            with self._open_media(file_path) as f, self._open_media(thumb_path, by_path=False) as t:
+                return bot.send_audio(chat_id=chat_id, audio=f, thumb=t, **kwargs)
+        return self.uploader.send_audio(chat_id, file_path, thumb_path, **kwargs)
+    
+    def _send_media(self, bot, chat_id, file_path: Path, info: Dict, **kwargs):
+        # الصوت يُرسل بـ send_audio مع العنوان والمؤدي، والفيديو بـ send_video مع الأبعاد
+        if info.get('kind') == 'audio':
+            kwargs.pop('supports_streaming', None)
+            return self._send_audio(bot, chat_id, file_path, info.get('thumb'),
+                                    **{**self.postprocessor.audio_kwargs(info), **kwargs})
+        return self._send_video(bot, chat_id, file_path, info.get('thumb'),
+                                **{**self.postprocessor.video_kwargs(info), **kwargs})
+    
     def get_main_keyboard(self) -> InlineKeyboardMarkup:
         keyboard = [
             [InlineKeyboardButton("📥 تحميل فيديو", callback_data="main_download")],
@@ -501,9 +2023,15 @@ class VideoBot:
             parse_mode='HTML',
             reply_markup=self.get_main_keyboard()
         )
+        
+        # رابط عميق من الوضع المضمن: /start dl-<مفتاح الرابط>
+        if context.args and context.args[0].startswith("dl-"):
+            url = self.urls.get(context.args[0][3:])
+            if isinstance(url, str):
+                self._offer_qualities(update, url)
     
     def help(self, update: Update, context: CallbackContext):
-        help_text = """
+        help_text = f"""
 ❓ **مساعدة البوت**
 
 📌 **كيفية الاستخدام:**
@@ -515,7 +2043,7 @@ class VideoBot:
 ✅ **نصائح:**
 • تأكد أن الرابط عام
 • الفيديوهات الطويلة تحتاج وقت
-• الحد الأقصى: 50 ميجابايت
+• الحد الأقصى: {MAX_FILE_SIZE // (1024 * 1024)} ميجابايت
 
 📬 **للاستفسارات:** /support
 📊 **إحصائياتك:** /stats
@@ -589,13 +2117,13 @@ class VideoBot:
             message = update.message.text
             
             # تسجيل الرسالة
-            self.logger.log_message(user.id, user.username, user.first_name, message)
+            ticket_id = self.logger.log_message(user.id, user.username, user.first_name, message)
             
             # إرسال إشعار للمشرف
             try:
                 context.bot.send_message(
                     ADMIN_ID,
-                    f"📬 **رسالة دعم جديدة**\n\n"
+                    f"📬 **رسالة دعم جديدة** #{ticket_id}\n\n"
                     f"👤 {user.first_name}\n"
                     f"🆔 {user.id}\n"
                     f"💬 {message}\n\n"
@@ -635,6 +2163,7 @@ class VideoBot:
                 parse_mode='Markdown'
             )
             
+            self.logger.mark_answered(user_id)
             update.effective_message.reply_text(f"✅ تم إرسال الرد للمستخدم {user_id}")
             
         except ValueError:
@@ -642,6 +2171,154 @@ class VideoBot:
         except Exception as e:
             update.effective_message.reply_text(f"❌ فشل الإرسال: {str(e)[:100]}")
     
+    # ========== تذاكر الدعم ==========
+    
+    def admin_tickets(self, update: Update, context: CallbackContext):
+        if update.effective_user.id != ADMIN_ID:
+            update.effective_message.reply_text("⛔ هذا الأمر للمشرف فقط")
+            return
+        
+        args = context.args or []
+        action = args[0].lower() if args else "recent"
+        
+        if action == "html":
+            mode, arg = context.user_data.get('tickets_filter', ("recent", None))
+            report_path = self.logger.export_html(mode, arg)
+            with open(report_path, 'rb') as f:
+                update.effective_message.reply_document(
+                    document=f,
+                    filename="support.html",
+                    caption="📬 سجل رسائل الدعم"
+                )
+            report_path.unlink()
+            return
+        
+        if action == "open":
+            ticket_filter = ("open", None)
+        elif action == "search" and len(args) > 1:
+            ticket_filter = ("search", ' '.join(args[1:]))
+        elif action == "user" and len(args) > 1:
+            if not args[1].isdigit():
+                update.effective_message.reply_text("❌ معرف المستخدم غير صحيح")
+                return
+            ticket_filter = ("user", args[1])
+        elif action == "recent":
+            ticket_filter = ("recent", None)
+        else:
+            update.effective_message.reply_text(
+                "❌ استخدم:\n"
+                "/tickets\n"
+                "/tickets open\n"
+                "/tickets search <نص>\n"
+                "/tickets user <user_id>\n"
+                "/tickets html"
+            )
+            return
+        
+        context.user_data['tickets_filter'] = ticket_filter
+        text, markup = self._render_tickets(context)
+        update.effective_message.reply_text(text, parse_mode='HTML', reply_markup=markup)
+    
+    def _render_tickets(self, context: CallbackContext, before: int = None, after: int = None) -> tuple:
+        mode, arg = context.user_data.get('tickets_filter', ("recent", None))
+        rows, has_more = self.logger.page(mode, arg, before=before, after=after)
+        
+        labels = {
+            "recent": "الأحدث",
+            "open": "بانتظار الرد",
+            "search": f"بحث: {arg}",
+            "user": f"المستخدم {arg}",
+        }
+        text = f"📬 <b>تذاكر الدعم</b> - {html.escape(labels.get(mode, mode))}\n"
+        text += f"⏳ بانتظار الرد: {self.logger.count_open()}\n\n"
+        
+        if not rows:
+            text += "لا توجد رسائل"
+        for row in rows:
+            status = "✅" if row['answered_at'] else "⏳"
+            timestamp = datetime.fromtimestamp(row['created_at']).strftime("%Y-%m-%d %H:%M")
+            text += f"#{row['id']} {status} <b>{html.escape(row['first_name'] or '')}</b> "
+            text += f"(@{html.escape(row['username'] or 'لا يوجد')}) 🆔 <code>{row['user_id']}</code>\n"
+            text += f"🕐 {timestamp}\n"
+            text += f"💬 {html.escape(row['message'][:200])}\n\n"
+        
+        nav = []
+        if rows and (before is not None or (after is not None and has_more)):
+            nav.append(InlineKeyboardButton("⬅️ الأحدث", callback_data=f"admin_tickets_newer_{rows[0]['id']}"))
+        if rows and (after is not None or has_more):
+            nav.append(InlineKeyboardButton("الأقدم ➡️", callback_data=f"admin_tickets_older_{rows[-1]['id']}"))
+        
+        keyboard = [nav] if nav else []
+        keyboard.append([InlineKeyboardButton("❌ إغلاق", callback_data="cancel")])
+        return text[:4000], InlineKeyboardMarkup(keyboard)
+    
+    # ========== دليل المستخدمين ==========
+    
+    def admin_users_command(self, update: Update, context: CallbackContext):
+        if update.effective_user.id != ADMIN_ID:
+            update.effective_message.reply_text("⛔ هذا الأمر للمشرف فقط")
+            return
+        
+        if context.args:
+            prefix = ' '.join(context.args)
+            context.user_data['users_search'] = prefix
+            text, markup = self._render_user_search(prefix)
+        else:
+            text, markup = self._render_users()
+        update.effective_message.reply_text(text, parse_mode='HTML', reply_markup=markup)
+    
+    @staticmethod
+    def _format_user(user: Dict) -> str:
+        name = html.escape((user.get('first_name') or 'مستخدم')[:30])
+        username = html.escape(user.get('username') or 'لا يوجد')
+        return (
+            f"• {name} (@{username})\n"
+            f"  🆔 <code>{user['id']}</code> | 📥 {user.get('downloads', 0)} | "
+            f"🕐 {(user.get('last_active') or '')[:10]}\n"
+        )
+    
+    def _render_users(self, sort: str = "d", cursor: tuple = None, direction: str = "next") -> tuple:
+        users, has_prev, has_next = self.db.page_users(sort, cursor, direction)
+        sort_names = {"d": "📥 التحميلات", "j": "📅 الانضمام", "a": "🕐 آخر نشاط"}
+        
+        text = f"👥 <b>قائمة المستخدمين</b> ({len(self.db.users)})\n"
+        text += f"الترتيب: {sort_names[sort]}\n\n"
+        text += ''.join(self._format_user(u) for u in users) or "لا يوجد مستخدمين"
+        
+        field = Database.SORTS[sort]
+        nav = []
+        if users and has_prev:
+            first = Database._sort_entry(field, users[0])
+            nav.append(InlineKeyboardButton("⬅️ السابق", callback_data=f"admin_users_{sort}_p_{first[0]}_{first[1]}"))
+        if users and has_next:
+            last = Database._sort_entry(field, users[-1])
+            nav.append(InlineKeyboardButton("التالي ➡️", callback_data=f"admin_users_{sort}_n_{last[0]}_{last[1]}"))
+        
+        keyboard = [[
+            InlineKeyboardButton(("✅ " if code == sort else "") + name, callback_data=f"admin_users_{code}")
+            for code, name in sort_names.items()
+        ]]
+        if nav:
+            keyboard.append(nav)
+        keyboard.append([InlineKeyboardButton("❌ إغلاق", callback_data="cancel")])
+        return text[:4000], InlineKeyboardMarkup(keyboard)
+    
+    def _render_user_search(self, prefix: str, offset: int = 0) -> tuple:
+        users, next_offset, has_more = self.db.search_users(prefix, offset)
+        
+        text = f"🔍 <b>بحث:</b> {html.escape(prefix)}\n\n"
+        text += ''.join(self._format_user(u) for u in users) or "لا توجد نتائج"
+        
+        nav = []
+        if offset > 0:
+            nav.append(InlineKeyboardButton("⬅️ السابق", callback_data=f"admin_users_s_{max(0, offset - USERS_PAGE_SIZE)}"))
+        if has_more:
+            nav.append(InlineKeyboardButton("التالي ➡️", callback_data=f"admin_users_s_{next_offset}"))
+        
+        keyboard = [nav] if nav else []
+        keyboard.append([InlineKeyboardButton("❌ إغلاق", callback_data="cancel")])
+        return text[:4000], InlineKeyboardMarkup(keyboard)
+    
     # ========== لوحة تحكم الآدمين ==========
     
     def admin_panel(self, update: Update, context: CallbackContext):
@@ -658,6 +2335,7 @@ class VideoBot:
 • المستخدمين: {stats['total_users']}
 • التحميلات: {stats['total_downloads']}
 • المساحة: {stats['total_size_mb']:.1f} MB
+• رسائل دعم بانتظار الرد: {self.logger.count_open()}
 
 ⚙️ **الإجراءات المتاحة:**
         """
@@ -665,6 +2343,7 @@ class VideoBot:
         keyboard = [
             [InlineKeyboardButton("📊 إحصائيات", callback_data="admin_stats")],
             [InlineKeyboardButton("👥 قائمة المستخدمين", callback_data="admin_users")],
+            [InlineKeyboardButton("📬 تذاكر الدعم", callback_data="admin_tickets")],
             [InlineKeyboardButton("📢 إذاعة رسالة", callback_data="admin_broadcast")],
             [InlineKeyboardButton("💾 تصدير الفيديوهات", callback_data="admin_export")],
             [InlineKeyboardButton("🧹 تنظيف الملفات", callback_data="admin_cleanup")],
@@ -714,24 +2393,55 @@ class VideoBot:
             
             if action == "stats":
                 stats = self.db.get_total_stats()
+                jobs = self.scheduler.stats()
+                url_stats = self.urls.stats()
+                failure_stats = self.failures.stats()
+                hits = failure_stats['hits']
                 query.edit_message_text(
                     f"📊 **الإحصائيات**\n\n"
                     f"👥 المستخدمين: {stats['total_users']}\n"
                     f"📥 التحميلات: {stats['total_downloads']}\n"
-                    f"💾 المساحة: {stats['total_size_mb']:.1f} MB"
+                    f"💾 المساحة: {stats['total_size_mb']:.1f} MB\n\n"
+                    f"⚙️ جارية: {jobs['running']} | بالانتظار: {jobs['queued']}\n"
+                    f"✅ مقبولة: {jobs['accepted']} | مكتملة: {jobs['completed']} | فاشلة: {jobs['failed']}\n"
+                    f"⛔ مرفوضة (المعدل): {jobs['throttled_rate']}\n"
+                    f"⛔ مرفوضة (التزامن): {jobs['throttled_concurrency']}\n\n"
+                    f"🔗 الروابط المحفوظة: {url_stats['entries']} "
+                    f"({url_stats['bytes'] / 1024:.0f} KB، محذوفة بسبب الحد: {url_stats['evictions']})\n\n"
+                    f"🚫 روابط فاشلة محفوظة: {failure_stats['entries']} | تم تجنبها: {sum(hits.values())} "
+                    f"(مرات الفحص بدون تطابق: {failure_stats['misses']})\n"
+                    f"🔒 خاص: {hits['private']} | 🗑 محذوف: {hits['removed']} | "
+                    f"⏱ طويل: {hits['too_long']} | 📦 كبير: {hits['too_large']} | 🔁 مؤقت: {hits['transient']}"
                 )
             
-            elif action == "users":
-                users = self.db.get_all_users()
-                text = "👥 **قائمة المستخدمين**\n\n"
-                for user in users[:20]:  # أول 20 مستخدم
-                    text += f"• {user['first_name']} (@{user['username'] or 'لا يوجد'})\n"
-                    text += f"  🆔 {user['id']} | 📥 {user['downloads']}\n\n"
-                
-                if len(users) > 20:
-                    text += f"...و {len(users)-20} آخرين"
-                
-                query.edit_message_text(text[:4000], parse_mode='Markdown')
+            elif action == "users" or action.startswith("users_"):
+                # users_<sort> | users_<sort>_<n|p>_<key>_<id> | users_s_<offset>
+                parts = action.split('_')
+                if len(parts) == 3 and parts[1] == "s":
+                    prefix = context.user_data.get('users_search', '')
+                    text, markup = self._render_user_search(prefix, int(parts[2]))
+                else:
+                    sort = parts[1] if len(parts) > 1 and parts[1] in Database.SORTS else "d"
+                    cursor, direction = None, "next"
+                    if len(parts) == 5:
+                        key = int(parts[3]) if sort == "d" else parts[3]
+                        cursor = (key, int(parts[4]))
+                        direction = "next" if parts[2] == "n" else "prev"
+                    text, markup = self._render_users(sort, cursor, direction)
+                query.edit_message_text(text, parse_mode='HTML', reply_markup=markup)
+            
+            elif action == "tickets":
+                context.user_data['tickets_filter'] = ("recent", None)
+                text, markup = self._render_tickets(context)
+                query.edit_message_text(text, parse_mode='HTML', reply_markup=markup)
+            
+            elif action.startswith("tickets_"):
+                _, direction, cursor = action.split('_', 2)
+                if direction == "older":
+                    text, markup = self._render_tickets(context, before=int(cursor))
+                else:
+                    text, markup = self._render_tickets(context, after=int(cursor))
+                query.edit_message_text(text, parse_mode='HTML', reply_markup=markup)
             
             elif action == "export":
                 query.edit_message_text("⏳ جاري إنشاء ملف الفيديوهات...")
@@ -741,7 +2451,7 @@ class VideoBot:
                     for video in VIDEOS_DIR.glob("*"):
                         zipf.write(video, video.name)
                 
-                with open(zip_path, 'rb') as f:
+                with self._open_media(zip_path) as f:
                     query.message.reply_document(
                         document=f,
                         filename="videos.zip",
@@ -780,61 +2490,128 @@ class VideoBot:
                 return
         
         # أزرار التحميل
-        if data.startswith("dl_"):
+        if data.startswith("dl_") or data.startswith("dlb_"):
             parts = data.split('_')
             if len(parts) >= 3:
+                kind = parts[0]
                 quality = parts[1]
                 url_hash = parts[2]
-                url = context.user_data.get(f'url_{url_hash}')
+                stored = self.urls.get(url_hash)
+                if kind == "dlb" and isinstance(stored, list):
+                    urls, url = stored, stored[0]
+                else:
+                    urls, url = None, stored if isinstance(stored, str) else None
                 
                 if not url:
                     query.edit_message_text("❌ انتهت صلاحية الرابط، أرسله مرة أخرى")
                     return
                 
-                self._process_download(query, context, url, quality, url_hash)
+                # رابط فشل مؤخراً يُرد عليه فوراً دون حجز مكان في الجدولة
+                cached = self._cached_failure(url, quality) if not urls else None
+                if cached:
+                    query.edit_message_text(cached)
+                    return
+                
+                job = self.journal.add(
+                    user_id=query.from_user.id,
+                    first_name=query.from_user.first_name,
+                    chat_id=query.message.chat_id,
+                    message_id=query.message.message_id,
+                    url=url,
+                    quality=quality,
+                    filename=self.downloader.output_name(url),
+                    urls=urls
+                )
+                accepted, retry_after, position = self._submit_job(context.bot, job)
+                if not accepted:
+                    self.journal.remove(job['id'])
+                    if retry_after:
+                        query.edit_message_text(
+                            f"⏳ طلبات كثيرة، حاول مرة أخرى بعد {math.ceil(retry_after)} ثانية"
+                        )
+                    else:
+                        query.edit_message_text(
+                            f"⏳ لديك {MAX_JOBS_PER_USER} عمليات تحميل جارية، انتظر حتى تنتهي ثم حاول مجدداً"
+                        )
+                elif position > 1:
+                    query.edit_message_text(f"🕐 في قائمة الانتظار (الترتيب {position})")
     
-    def _process_download(self, query, context, url, quality, url_hash):
-        quality_info = self.downloader.QUALITIES[quality]
-        
-        query.edit_message_text(
-            f"⏳ **جاري التحميل...**\n"
-            f"🎯 الجودة: {quality_info['name']}",
-            parse_mode='Markdown'
-        )
-        
-        result = self.downloader.download(url, quality)
-        
-        if isinstance(result, tuple) and len(result) == 2:
-            if result[0] is None:
-                query.edit_message_text(result[1])
-                return
-            file_path, info = result
-        else:
-            query.edit_message_text("❌ فشل التحميل")
-            return
+    def _edit_status(self, bot, job: Dict, text: str, **kwargs):
+        try:
+            bot.edit_message_text(text, chat_id=job['chat_id'], message_id=job['message_id'], **kwargs)
+        except Exception as e:
+            logger.warning(f"تعذر تحديث رسالة الحالة: {e}")
+    
+    def _process_download(self, bot, job: Dict):
+        quality_info = self.downloader.QUALITIES[job['quality']]
+        file_path = job.get('file_path')
+        info = job.get('info')
         
-        # تحديث الإحصائيات
-        self.db.increment_download(query.from_user.id, info['size'])
+        try:
+            if not (file_path and info and file_path.exists()):
+                self._edit_status(
+                    bot, job,
+                    f"⏳ **جاري التحميل...**\n"
+                    f"🎯 الجودة: {quality_info['name']}",
+                    parse_mode='Markdown'
+                )
+                self.journal.update(job['id'], 'downloading')
+                
+                started = time.monotonic()
+                result = self._run_download(job['url'], job['quality'], job['filename'])
+                logger.info(
+                    f"انتهى تحميل المهمة {job['id']}",
+                    extra={
+                        "job_id": job['id'],
+                        "user_id": job['user_id'],
+                        "platform": self.downloader.detect_platform(job['url'])[0],
+                        "stage": "download",
+                        "elapsed": time.monotonic() - started
+                    }
+                )
+                
+                if isinstance(result, tuple) and len(result) == 2:
+                    if result[0] is None:
+                        self._edit_status(bot, job, result[1])
+                        return
+                    file_path, info = result
+                else:
+                    self._edit_status(bot, job, "❌ فشل التحميل")
+                    return
+                
+                # تحديث الإحصائيات
+                self.db.increment_download(job['user_id'], info['size'])
+                self.journal.update(job['id'], 'downloaded', file_path, info)
+            
+            self._upload(bot, job, file_path, info, quality_info)
+        finally:
+            self.journal.remove(job['id'])
+    
+    def _upload(self, bot, job: Dict, file_path: Path, info: Dict, quality_info: Dict):
+        # faststart والصورة المصغرة جاهزة من _run_download
+        thumb_path = info.get('thumb')
+        self.journal.update(job['id'], 'uploading')
         
         # إرسال للقناة إذا وجدت
         if CHANNEL_ID and CHANNEL_ID != "@your_channel_username":
             try:
-                with open(file_path, 'rb') as f:
-                    context.bot.send_video(
-                        chat_id=CHANNEL_ID,
-                        video=f,
-                        caption=f"📥 تم التحميل بواسطة {query.from_user.first_name}",
-                        supports_streaming=True
-                    )
+                self._send_media(
+                    bot,
+                    CHANNEL_ID,
+                    file_path,
+                    info,
+                    caption=f"📥 تم التحميل بواسطة {job['first_name']}",
+                    supports_streaming=True
+                )
             except Exception as e:
                 logger.error(f"فشل إرسال للقناة: {e}")
         
         # رفع للمستخدم
-        query.edit_message_text("📤 **جاري رفع الفيديو...**", parse_mode='Markdown')
+        media_label = "الملف الصوتي" if info.get('kind') == 'audio' else "الفيديو"
+        self._edit_status(bot, job, f"📤 **جاري رفع {media_label}...**", parse_mode='Markdown')
         
         try:
             # تنظيف العنوان من الرموز التي قد تسبب أخطاء
-            import html
             safe_title = html.escape(info['title'])
             safe_platform = html.escape(info['platform'])
             
@@ -850,26 +2627,207 @@ class VideoBot:
 📥 أرسل رابطاً آخر للتحميل
             """
             
-            with open(file_path, 'rb') as f:
-                query.message.reply_video(
-                    video=f,
-                    caption=caption,
-                    supports_streaming=True,
-                    timeout=300,
-                    parse_mode='HTML'
-                )
+            message = self._send_media(
+                bot,
+                job['chat_id'],
+                file_path,
+                info,
+                caption=caption,
+                supports_streaming=True,
+                timeout=300,
+                parse_mode='HTML'
+            )
+            self._remember_media(job['url'], job['quality'], info, message)
             
-            query.delete_message()
+            bot.delete_message(job['chat_id'], job['message_id'])
             
         except Exception as e:
             logger.error(f"خطأ في إرسال الفيديو: {e}")
-            query.edit_message_text(f"❌ فشل الرفع: {str(e)[:100]}")
+            self._edit_status(bot, job, f"❌ فشل الرفع: {str(e)[:100]}")
         
         finally:
-            try:
-                file_path.unlink()
-            except:
-                pass
+            for path in (file_path, thumb_path):
+                try:
+                    if path:
+                        path.unlink()
+                except:
+                    pass
+    
+    @staticmethod
+    def _sent_file_id(message, kind: str) -> Optional[str]:
+        # النتيجة إما Message من PTB أو dict من الرفع المتدفق
+        media = message.get(kind) if isinstance(message, dict) else getattr(message, kind, None)
+        if not media:
+            return None
+        return media.get('file_id') if isinstance(media, dict) else media.file_id
+    
+    def _remember_media(self, url: str, quality: str, info: Dict, message):
+        kind = info.get('kind', 'video')
+        try:
+            file_id = self._sent_file_id(message, kind)
+            if file_id:
+                self.media_index.add(self.downloader.media_key(url), quality, kind, file_id, info.get('title'))
+        except Exception as e:
+            logger.warning(f"تعذر حفظ file_id: {e}")
+    
+    def handle_inline(self, update: Update, context: CallbackContext):
+        inline_query = update.inline_query
+        urls = re.findall(r'https?://[^\s]+', inline_query.query or '')
+        
+        if not urls:
+            inline_query.answer([], cache_time=5, is_personal=True,
+                                switch_pm_text="📥 أرسل رابطاً للبوت", switch_pm_parameter="start")
+            return
+        
+        url = urls[0]
+        results = []
+        for row in self.media_index.lookup(self.downloader.media_key(url)):
+            quality_name = self.downloader.QUALITIES.get(row['quality'], {}).get('name', row['quality'])
+            title = f"{row['title'] or 'فيديو'} - {quality_name}"
+            result_id = hashlib.md5(f"{row['media_key']}:{row['quality']}".encode()).hexdigest()
+            if row['kind'] == 'audio':
+                results.append(InlineQueryResultCachedAudio(id=result_id, audio_file_id=row['file_id']))
+            else:
+                results.append(InlineQueryResultCachedVideo(id=result_id, video_file_id=row['file_id'], title=title))
+        
+        if results:
+            inline_query.answer(results, cache_time=300)
+        else:
+            # غير موجود بعد: نحيل المستخدم للمحادثة الخاصة مع الرابط جاهزاً
+            inline_query.answer([], cache_time=5, is_personal=True,
+                                switch_pm_text="📥 غير محمّل بعد، أرسله للبوت",
+                                switch_pm_parameter=f"dl-{self.urls.put(url)}")
+    
+    def _submit_job(self, bot, job: Dict, admit: bool = True) -> tuple:
+        # روابط الدفعة تُجدول منفردة، فيُحسب لكل رابط رمز ومكان في التناوب وحد التزامن
+        if not job.get('urls'):
+            return self.scheduler.submit(job['user_id'], self._process_download, bot, job, admit=admit)
+        
+        batch = {"lock": threading.Lock(), "started": False, "remaining": len(job['urls']), "results": {}}
+        tasks = [
+            (self._process_batch_item, (bot, job, batch, i, url))
+            for i, url in enumerate(job['urls'])
+        ]
+        return self.scheduler.submit_many(job['user_id'], tasks, admit=admit)
+    
+    def _send_media_group(self, bot, chat_id, items: List[Dict]):
+        # sendMediaGroup يحتاج عنصرين على الأقل
+        if len(items) == 1:
+            item = items[0]
+            if item.get('type') == 'audio':
+                return self._send_audio(bot, chat_id, item['path'], item.get('thumb'), **item['params'])
+            return self._send_video(bot, chat_id, item['path'], item.get('thumb'), supports_streaming=True, **item['params'])
+        
+        if LOCAL_BOT_API:
+            with ExitStack() as stack:
+                media = []
+                for item in items:
+                    path = stack.enter_context(self._open_media(item['path']))
+                    thumb = stack.enter_context(self._open_media(item.get('thumb'), by_path=False))
+                    if item.get('type') == 'audio':
+                        media.append(InputMediaAudio(media=path, thumb=thumb, **item['params']))
+                    else:
+                        media.append(InputMediaVideo(media=path, thumb=thumb, supports_streaming=True, **item['params']))
+                return bot.send_media_group(chat_id, media, timeout=300)
+        return self.uploader.send_media_group(chat_id, items)
+    
+    def _process_batch_item(self, bot, job: Dict, batch: Dict, index: int, url: str):
+        # آخر رابط ينتهي تحميله هو من يرفع الدفعة كاملة
+        with batch['lock']:
+            first = not batch['started']
+            batch['started'] = True
+        if first:
+            self._edit_status(
+                bot, job,
+                f"⏳ **جاري تحميل {len(job['urls'])} روابط...**\n"
+                f"🎯 الجودة: {self.downloader.QUALITIES[job['quality']]['name']}",
+                parse_mode='Markdown'
+            )
+            self.journal.update(job['id'], 'downloading')
+        
+        result = None
+        try:
+            # لكل رابط اسم ثابت ليُستكمل تحميله بعد إعادة التشغيل
+            result = self._run_download(url, job['quality'], f"{job['filename']}_{index}")
+        finally:
+            with batch['lock']:
+                batch['results'][index] = result
+                batch['remaining'] -= 1
+                last = batch['remaining'] == 0
+            if last:
+                self._process_batch(bot, job, [batch['results'][i] for i in range(len(job['urls']))])
+    
+    def _process_batch(self, bot, job: Dict, results: List):
+        quality_info = self.downloader.QUALITIES[job['quality']]
+        urls = job['urls']
+        cleanup = []
+        
+        try:
+            items, failures = [], []
+            for i, result in enumerate(results, 1):
+                if not (isinstance(result, tuple) and len(result) == 2):
+                    result = (None, "❌ فشل التحميل")
+                file_path, info = result
+                if file_path is None:
+                    failures.append(f"{i}. {info}")
+                    continue
+                
+                cleanup += [file_path, info.get('thumb')]
+                self.db.increment_download(job['user_id'], info['size'])
+                is_audio = info.get('kind') == 'audio'
+                media_kwargs = self.postprocessor.audio_kwargs(info) if is_audio else self.postprocessor.video_kwargs(info)
+                items.append({
+                    "index": i,
+                    "url": urls[i - 1],
+                    "info": info,
+                    "type": info.get('kind', 'video'),
+                    "path": file_path,
+                    "thumb": info.get('thumb'),
+                    "params": {
+                        "caption": f"{'🎧' if is_audio else '📹'} <b>{html.escape(info['title'])}</b>\n🌐 {html.escape(info['platform'])}",
+                        "parse_mode": "HTML",
+                        **media_kwargs
+                    }
+                })
+            
+            sent = 0
+            if items:
+                self.journal.update(job['id'], 'uploading')
+                self._edit_status(bot, job, f"📤 **جاري رفع {len(items)} فيديو...**", parse_mode='Markdown')
+            
+            for start in range(0, len(items), MEDIA_GROUP_SIZE):
+                group = items[start:start + MEDIA_GROUP_SIZE]
+                
+                if CHANNEL_ID and CHANNEL_ID != "@your_channel_username":
+                    try:
+                        self._send_media_group(bot, CHANNEL_ID, group)
+                    except Exception as e:
+                        logger.error(f"فشل إرسال للقناة: {e}")
+                
+                try:
+                    messages = self._send_media_group(bot, job['chat_id'], group)
+                    if not isinstance(messages, list):
+                        messages = [messages]
+                    for item, message in zip(group, messages):
+                        self._remember_media(item['url'], job['quality'], item['info'], message)
+                    sent += len(group)
+                except Exception as e:
+                    logger.error(f"خطأ في إرسال مجموعة الفيديوهات: {e}")
+                    failures += [f"{item['index']}. ❌ فشل الرفع: {str(e)[:100]}" for item in group]
+            
+            summary = f"📦 <b>اكتمل التحميل:</b> {sent}/{len(urls)}\n🎯 <b>الجودة:</b> {quality_info['name']}"
+            if failures:
+                summary += "\n\n" + "\n".join(html.escape(f) for f in sorted(failures, key=lambda f: int(f.split('.')[0])))
+            self._edit_status(bot, job, summary, parse_mode='HTML')
+        
+        finally:
+            for path in cleanup:
+                try:
+                    if path:
+                        path.unlink()
+                except:
+                    pass
+            self.journal.remove(job['id'])
     
     def handle_text(self, update: Update, context: CallbackContext):
         if not update.message or not update.message.text:
@@ -897,16 +2855,28 @@ class VideoBot:
         urls = re.findall(r'https?://[^\s]+', text)
         
         if urls:
-            url = urls[0]
-            platform_id, platform_name = self.downloader.detect_platform(url)
-            url_hash = hashlib.md5(url.encode()).hexdigest()[:8]
-            
-            context.user_data[f'url_{url_hash}'] = url
+            urls = list(dict.fromkeys(urls))
+            over_limit = urls[BATCH_MAX_URLS:]
+            urls = urls[:BATCH_MAX_URLS]
+            # كل رابط يستهلك رمزاً من حد المعدل، فيُقبل من الدفعة ما يسمح به الرصيد الحالي فقط
+            admitted, retry_after = self.scheduler.capacity(update.effective_user.id, len(urls))
+            throttled = urls[admitted:]
+            urls = urls[:admitted]
             
-            text = f"{platform_name} ✅ **تم اكتشاف الفيديو**\n\nاختر الجودة:"
-            keyboard = self.downloader.get_quality_buttons(url_hash)
+            if over_limit or throttled:
+                self._report_dropped_urls(update, over_limit, throttled, retry_after)
+            if not urls:
+                return
+            if len(urls) > 1:
+                batch_hash = self.urls.put(urls)
+                
+                text = f"📦 **تم اكتشاف {len(urls)} روابط**\n\nاختر الجودة لجميعها:"
+                keyboard = self.downloader.get_quality_buttons(batch_hash, prefix="dlb")
+                
+                update.effective_message.reply_text(text, parse_mode='Markdown', reply_markup=keyboard)
+                return
             
-            update.effective_message.reply_text(text, parse_mode='Markdown', reply_markup=keyboard)
+            self._offer_qualities(update, urls[0])
         else:
             # إذا كان المستخدم في وضع الدعم
             if context.user_data.get('waiting_for_support'):
@@ -920,6 +2890,30 @@ class VideoBot:
                     "أرسل رابطاً من يوتيوب، انستغرام، تيك توك..."
                 )
     
+    def _report_dropped_urls(self, update: Update, over_limit: List[str], throttled: List[str], retry_after: float):
+        # بدون Markdown لأن الروابط قد تحتوي رموزاً تكسر التنسيق
+        parts = []
+        if throttled:
+            parts.append(
+                f"⏳ طلبات كثيرة، لم تُقبل هذه الروابط. أرسلها مجدداً بعد {math.ceil(retry_after)} ثانية:\n"
+                + "\n".join(throttled)
+            )
+        if over_limit:
+            parts.append(
+                f"⚠️ الحد الأقصى {BATCH_MAX_URLS} روابط في الرسالة، تم تجاهل:\n"
+                + "\n".join(over_limit)
+            )
+        update.effective_message.reply_text("\n\n".join(parts), disable_web_page_preview=True)
+    
+    def _offer_qualities(self, update: Update, url: str):
+        platform_id, platform_name = self.downloader.detect_platform(url)
+        url_hash = self.urls.put(url)
+        
+        text = f"{platform_name} ✅ **تم اكتشاف الفيديو**\n\nاختر الجودة:"
+        keyboard = self.downloader.get_quality_buttons(url_hash)
+        
+        update.effective_message.reply_text(text, parse_mode='Markdown', reply_markup=keyboard)
+    
     def _handle_admin_broadcast(self, update: Update, context: CallbackContext):
         message = update.message.text
         users = self.db.get_all_users()
@@ -944,14 +2938,37 @@ class VideoBot:
     
     # ========== وظائف مساعدة ==========
     
+    def resume_job(self, context: CallbackContext):
+        pending = self.journal.pending()
+        if not pending:
+            return
+        logger.info(f"♻️ استئناف {len(pending)} طلب بعد إعادة التشغيل")
+        
+        for job in pending:
+            if time.time() - job['created_at'] > JOURNAL_MAX_AGE:
+                self.journal.remove(job['id'])
+                self._edit_status(context.bot, job, "❌ انتهت صلاحية الطلب بعد إعادة تشغيل البوت، أرسل الرابط مرة أخرى")
+                continue
+            
+            self._edit_status(context.bot, job, "♻️ تم استئناف طلبك بعد إعادة تشغيل البوت...")
+            self._submit_job(context.bot, job, admit=False)
+    
     def cleanup_job(self, context: CallbackContext):
         try:
             cleaned = 0
-            for f in VIDEOS_DIR.glob("*"):
+            # ملفات .part للطلبات المسجلة تبقى ليُستكمل تحميلها
+            active = self.journal.active_filenames()
+            staged = self.downloader.staging_path.glob("*") if self.downloader.staging_path else []
+            for f in itertools.chain(VIDEOS_DIR.glob("*"), staged):
+                if any(f.name.startswith(name) for name in active):
+                    continue
                 if time.time() - f.stat().st_mtime > 3600:
                     f.unlink()
                     cleaned += 1
-            logger.info(f"تنظيف دوري: {cleaned} ملف")
+            logger.info(
+                f"تنظيف دوري: {cleaned} ملف، {self.urls.purge()} رابط منتهي، "
+                f"{self.failures.purge()} خطأ منتهي"
+            )
         except Exception as e:
             logger.error(f"خطأ في التنظيف: {e}")
     
@@ -982,6 +2999,12 @@ class VideoBot:
         print(f"📋 القناة: {CHANNEL_ID}\n")
         
         self.updater.start_polling()
+        logger.info(f"⏱️ بدء الاستقبال بعد {time.monotonic() - _STARTED_AT:.2f} ثانية من الإقلاع")
+        
+        # تحميل yt-dlp وبيانات المستخدمين في الخلفية بعد بدء الاستقبال
+        threading.Thread(target=warm_up_yt_dlp, daemon=True).start()
+        threading.Thread(target=lambda: self.db.users, daemon=True).start()
+        
         self.updater.idle()
 
 
@@ -1022,6 +3045,17 @@ def self_ping():
 
 if __name__ == "__main__":
     import threading
+    
+    # عامل تحميل مستقل يشارك نفس data/ (لإضافة أنوية أو أجهزة أخرى)
+    if len(sys.argv) > 1 and sys.argv[1] == "worker":
+        # اسم ثابت عبر إعادة التشغيل حتى لا تتراكم ملفات سجل جديدة، وWORKER_ID مختلف لكل عامل إضافي على نفس الجهاز
+        worker_id = os.getenv("WORKER_ID") or socket.gethostname()
+        setup_runtime(f"worker-{worker_id}")
+        # البوت لا يرى /dev/shm الخاص بهذا العامل، فكل الملفات تُحمّل إلى data/ المشترك
+        run_download_worker(worker_id, staging_path=None)
+        sys.exit(0)
+    
+    setup_runtime()
 
     # Start the simple HTTP server thread
     threading.Thread(target=run_server, daemon=True).start()
@@ -0,0 +1,170 @@
+import json
+import sys
+import tempfile
+import threading
+import unittest
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+try:
+    from bott import Database
+except ImportError as e:
+    raise unittest.SkipTest(f"bot dependencies are not installed: {e}")
+
+
+class DatabaseTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = Database()
+        self.db.users_file = Path(self.tmp.name) / "users.json"
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def add_users(self, count: int):
+        base = datetime(2024, 1, 1)
+        for i in range(count):
+            self.db.add_user(i, f"user{i}", f"name{i}")
+            user = self.db.users[str(i)]
+            # قيم متكررة في التحميلات لاختبار الترتيب الثانوي بالـ id
+            self.db._index_user(user, add=False)
+            user["downloads"] = i % 7
+            user["joined"] = (base + timedelta(days=i)).isoformat()
+            user["last_active"] = (base + timedelta(hours=(i * 37) % count)).isoformat()
+            self.db._index_user(user)
+
+
+class PageUsersTest(DatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.add_users(37)
+
+    def expected(self, field: str) -> list:
+        users = self.db.get_all_users()
+        return [u["id"] for u in sorted(users, key=lambda u: (u[field], u["id"]), reverse=True)]
+
+    def walk_forward(self, sort: str, limit: int) -> list:
+        field = Database.SORTS[sort]
+        pages, cursor = [], None
+        while True:
+            page, has_prev, has_next = self.db.page_users(sort, cursor, "next", limit)
+            self.assertEqual(has_prev, bool(pages))
+            pages.append([u["id"] for u in page])
+            if not has_next:
+                return pages
+            cursor = Database._sort_entry(field, page[-1])
+
+    def test_forward_paging_covers_every_sort(self):
+        for sort, field in Database.SORTS.items():
+            with self.subTest(sort=sort):
+                pages = self.walk_forward(sort, 10)
+                self.assertEqual([len(p) for p in pages], [10, 10, 10, 7])
+                self.assertEqual([uid for p in pages for uid in p], self.expected(field))
+
+    def test_back_paging_returns_the_same_pages(self):
+        for sort, field in Database.SORTS.items():
+            with self.subTest(sort=sort):
+                pages = self.walk_forward(sort, 10)
+                back = [pages[-1]]
+                page = [self.db.users[str(uid)] for uid in pages[-1]]
+                while True:
+                    cursor = Database._sort_entry(field, page[0])
+                    page, has_prev, _ = self.db.page_users(sort, cursor, "prev", 10)
+                    back.append([u["id"] for u in page])
+                    if not has_prev:
+                        break
+                self.assertEqual(back[::-1], pages)
+
+    def test_top_users_follow_downloads_index(self):
+        top = [u["id"] for u in self.db.get_top_users(5)]
+        self.assertEqual(top, self.expected("downloads")[:5])
+
+    def test_increment_moves_user_in_index(self):
+        self.db.increment_download(0, 2.5)
+        self.db.increment_download(0, 2.5)
+        for _ in range(10):
+            self.db.increment_download(0)
+        self.assertEqual(self.db.get_top_users(1)[0]["id"], 0)
+        self.assertEqual(self.db.get_total_stats()["total_size_mb"], 5.0)
+
+
+class SearchUsersTest(DatabaseTestCase):
+
+    def test_user_matching_both_names_is_listed_once(self):
+        self.db.add_user(1, "sara", "sara_k")
+        self.db.add_user(2, "sami", None)
+        self.db.add_user(3, "omar", "sam")
+
+        users, next_offset, has_more = self.db.search_users("@sa")
+        self.assertEqual(sorted(u["id"] for u in users), [1, 2, 3])
+        self.assertEqual(next_offset, 3)
+        self.assertFalse(has_more)
+
+    def test_offset_paging_counts_users(self):
+        for i in range(23):
+            # الاسم واسم المستخدم يطابقان البحث، فلكل مستخدم مدخلان في الفهرس
+            self.db.add_user(i, f"ali{i:02d}", f"ali_{i:02d}")
+        self.db.add_user(100, "bob", "bobby")
+
+        pages, offset = [], 0
+        while True:
+            users, offset, has_more = self.db.search_users("ali", offset, 10)
+            pages.append([u["id"] for u in users])
+            if not has_more:
+                break
+
+        ids = [uid for page in pages for uid in page]
+        self.assertEqual([len(p) for p in pages], [10, 10, 3])
+        self.assertEqual(sorted(ids), list(range(23)))
+
+        previous, _, _ = self.db.search_users("ali", 20 - 10, 10)
+        self.assertEqual([u["id"] for u in previous], pages[1])
+
+    def test_rename_updates_name_index(self):
+        self.db.add_user(1, "old", None)
+        self.db.add_user(1, "new", None)
+        self.assertEqual(self.db.search_users("old")[0], [])
+        self.assertEqual([u["id"] for u in self.db.search_users("new")[0]], [1])
+
+
+class ConcurrentWritesTest(DatabaseTestCase):
+
+    def test_increments_and_adds_from_several_threads(self):
+        self.db.add_user(1, "busy")
+        errors = []
+
+        def run(fn):
+            try:
+                fn()
+            except Exception as e:
+                errors.append(e)
+
+        def increments():
+            for _ in range(300):
+                self.db.increment_download(1, 1.0)
+
+        def additions():
+            for i in range(300):
+                self.db.add_user(1000 + i, f"new{i}")
+
+        threads = [threading.Thread(target=run, args=(fn,)) for fn in (increments, increments, increments, additions)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(errors, [])
+        with open(self.db.users_file, encoding="utf-8") as f:
+            saved = json.load(f)
+        self.assertEqual(len(saved), 301)
+        self.assertEqual(saved["1"]["downloads"], 900)
+        self.assertEqual(self.db.get_total_stats()["total_downloads"], 900)
+        self.assertFalse(self.db.users_file.with_name("users.json.tmp").exists())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,110 @@
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+try:
+    import bott
+except ImportError as e:
+    raise unittest.SkipTest(f"bot dependencies are not installed: {e}")
+
+
+class JobsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+        bott.DATA_DIR.mkdir(parents=True, exist_ok=True)
+        self.jobs = bott.JobQueue(Path(self.tmp.name) / "jobs.db")
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def status(self, job_id: int):
+        row = self.jobs.conn.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return row['status'] if row else None
+
+
+class JobQueueTest(JobsTestCase):
+
+    def test_timeout_starts_at_claim(self):
+        job_id = self.jobs.enqueue("https://example.com/v", "best", "f")
+
+        def worker():
+            time.sleep(0.6)
+            job = self.jobs.claim("w")
+            time.sleep(0.3)
+            self.jobs.complete(job['id'], Path("f.mp4"), {"size": 1})
+
+        threading.Thread(target=worker).start()
+        file_path, info = self.jobs.wait(job_id, timeout=0.5, queue_timeout=5)
+        self.assertEqual(file_path, Path("f.mp4"))
+        self.assertIsNone(self.status(job_id))
+
+    def test_cancelled_job_is_dropped_on_complete(self):
+        job_id = self.jobs.enqueue("https://example.com/v", "best", "f")
+        self.jobs.claim("w")
+        self.assertEqual(self.jobs.wait(job_id, timeout=0.1), (None, "❌ انتهت مهلة التحميل"))
+        self.assertEqual(self.status(job_id), 'cancelled')
+        self.assertTrue(self.jobs.is_cancelled(job_id))
+
+        self.assertFalse(self.jobs.complete(job_id, Path("f.mp4"), {}))
+        self.assertIsNone(self.status(job_id))
+
+    def test_unclaimed_job_is_removed_after_queue_timeout(self):
+        job_id = self.jobs.enqueue("https://example.com/v", "best", "f")
+        file_path, error = self.jobs.wait(job_id, timeout=5, queue_timeout=0.1)
+        self.assertIsNone(file_path)
+        self.assertIn("مشغولة", error)
+        self.assertIsNone(self.status(job_id))
+        self.assertIsNone(self.jobs.claim("w"))
+
+    def test_fail_worker_fails_only_its_running_jobs(self):
+        mine = self.jobs.enqueue("https://example.com/a", "best")
+        other = self.jobs.enqueue("https://example.com/b", "best")
+        queued = self.jobs.enqueue("https://example.com/c", "best")
+        self.jobs.claim("dead")
+        self.jobs.claim("alive")
+
+        self.assertEqual(self.jobs.fail_worker("dead", "❌ crash"), 1)
+        self.assertEqual(self.status(mine), 'failed')
+        self.assertEqual(self.status(other), 'running')
+        self.assertEqual(self.status(queued), 'queued')
+        self.assertEqual(self.jobs.wait(mine), (None, "❌ crash"))
+
+
+class SupervisorTest(JobsTestCase):
+
+    def test_dead_worker_is_restarted_and_its_jobs_failed(self):
+        bot = bott.VideoBot.__new__(bott.VideoBot)
+        bot.jobs = bot._start_workers(1)
+        try:
+            process = bot._workers[0]
+            worker_id = f"{bott.socket.gethostname()}-0"
+            job_id = bot.jobs.enqueue("https://example.com/v", "best")
+            bot.jobs.conn.execute("UPDATE jobs SET status = 'running', worker = ? WHERE id = ?", (worker_id, job_id))
+
+            process.kill()
+            process.join(timeout=10)
+            bot.supervise_workers()
+
+            self.assertIsNot(bot._workers[0], process)
+            self.assertTrue(bot._workers[0].is_alive())
+            file_path, error = bot.jobs.wait(job_id, timeout=1)
+            self.assertIsNone(file_path)
+            self.assertIn("توقف عامل التحميل", error)
+        finally:
+            for process in bot._workers.values():
+                process.kill()
+                process.join(timeout=10)
+
+
+if __name__ == "__main__":
+    unittest.main()
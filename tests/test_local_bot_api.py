@@ -0,0 +1,134 @@
+import importlib
+import json
+import os
+import sys
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+TOKEN = "123:stub"
+
+
+class StubBotApi(BaseHTTPRequestHandler):
+    """خادم Bot API وهمي يسجل الطلبات ويرد بنجاح"""
+
+    requests = []
+
+    def _result(self, method: str):
+        if method == "getMe":
+            return {"id": 1, "is_bot": True, "first_name": "stub", "username": "stub_bot"}
+        return {"message_id": len(self.requests), "date": 0, "chat": {"id": 1, "type": "private"}}
+
+    def _reply(self, body: bytes):
+        method = self.path.rsplit('/', 1)[-1].split('?')[0]
+        self.requests.append({
+            "path": self.path,
+            "content_type": self.headers.get('Content-Type', ''),
+            "body": body,
+        })
+        payload = json.dumps({"ok": True, "result": self._result(method)}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_POST(self):
+        self._reply(self.rfile.read(int(self.headers.get('Content-Length') or 0)))
+
+    def do_GET(self):
+        self._reply(b"")
+
+    def log_message(self, *args):
+        pass
+
+
+class LocalBotApiTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), StubBotApi)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base_url = f"http://127.0.0.1:{cls.server.server_port}/bot"
+
+        os.environ["BOT_API_BASE_URL"] = cls.base_url
+        os.environ["WORKER_PROCESSES"] = "0"
+        try:
+            cls.bott = importlib.reload(importlib.import_module("bott"))
+        except ImportError as e:
+            cls.server.shutdown()
+            cls.server.server_close()
+            raise unittest.SkipTest(f"bot dependencies are not installed: {e}")
+
+        cls.cwd = os.getcwd()
+        cls.tmp = tempfile.TemporaryDirectory()
+        os.chdir(cls.tmp.name)
+        for dir_path in [cls.bott.DATA_DIR, cls.bott.VIDEOS_DIR, cls.bott.LOGS_DIR]:
+            dir_path.mkdir(parents=True, exist_ok=True)
+
+        cls.video = Path(cls.tmp.name) / "clip.mp4"
+        cls.video.write_bytes(b"\x00\x01video-bytes" * 1000)
+
+    @classmethod
+    def tearDownClass(cls):
+        os.chdir(cls.cwd)
+        cls.tmp.cleanup()
+        cls.server.shutdown()
+        cls.server.server_close()
+        os.environ.pop("BOT_API_BASE_URL", None)
+        os.environ.pop("WORKER_PROCESSES", None)
+
+    def setUp(self):
+        StubBotApi.requests.clear()
+
+    def test_local_mode_enabled_by_base_url(self):
+        self.assertTrue(self.bott.LOCAL_BOT_API)
+        self.assertEqual(self.bott.MAX_FILE_SIZE, 2000 * 1024 * 1024)
+        self.assertIsNone(self.bott.STAGING_DIR)
+
+    def test_open_media_hands_off_file_uri(self):
+        with self.bott.VideoBot._open_media(None, self.video) as media:
+            self.assertEqual(media, self.video.resolve().as_uri())
+            self.assertTrue(media.startswith("file://"))
+
+    def test_open_media_uploads_thumbnail_content(self):
+        with self.bott.VideoBot._open_media(None, self.video, by_path=False) as media:
+            self.assertEqual(media.read(), self.video.read_bytes())
+
+    def test_open_media_without_path(self):
+        with self.bott.VideoBot._open_media(None, None) as media:
+            self.assertIsNone(media)
+
+    def test_updater_uses_base_url(self):
+        bot = self.bott.VideoBot(TOKEN)
+        me = bot.updater.bot.get_me()
+
+        self.assertEqual(me.username, "stub_bot")
+        self.assertEqual(StubBotApi.requests[-1]["path"], f"/bot{TOKEN}/getMe")
+
+    def test_send_video_passes_path_to_local_server(self):
+        bot = self.bott.VideoBot(TOKEN)
+        bot._send_video(bot.updater.bot, 42, self.video)
+
+        request = StubBotApi.requests[-1]
+        self.assertEqual(request["path"], f"/bot{TOKEN}/sendVideo")
+        self.assertIn(self.video.resolve().as_uri().encode(), request["body"])
+        self.assertNotIn(b"video-bytes", request["body"])
+
+    def test_streaming_uploader_multipart_fallback(self):
+        uploader = self.bott.StreamingUploader(TOKEN)
+        uploader.send_video(42, self.video, caption="clip")
+
+        request = StubBotApi.requests[-1]
+        self.assertEqual(request["path"], f"/bot{TOKEN}/sendVideo")
+        self.assertTrue(request["content_type"].startswith("multipart/form-data"))
+        self.assertIn(self.video.read_bytes(), request["body"])
+        self.assertIn(b'name="caption"', request["body"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,178 @@
+import sys
+import threading
+import time
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+try:
+    from bott import FairScheduler, TokenBucket
+except ImportError as e:
+    raise unittest.SkipTest(f"bot dependencies are not installed: {e}")
+
+ADMIN = 999
+
+
+class SchedulerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.gate = threading.Event()
+        self.order = []
+        self.lock = threading.Lock()
+        self.running = {}
+        self.peak = {}
+
+    def tearDown(self):
+        self.gate.set()
+
+    def make(self, **kwargs) -> FairScheduler:
+        options = {"workers": 1, "rate_per_minute": 600, "burst": 100, "max_per_user": 100, "priority_users": (ADMIN,)}
+        options.update(kwargs)
+        return FairScheduler(**options)
+
+    def task(self, user_id: int, duration: float = 0):
+        with self.lock:
+            self.order.append(user_id)
+            self.running[user_id] = self.running.get(user_id, 0) + 1
+            self.peak[user_id] = max(self.peak.get(user_id, 0), self.running[user_id])
+        time.sleep(duration)
+        with self.lock:
+            self.running[user_id] -= 1
+
+    def block_workers(self, scheduler: FairScheduler, count: int = 1):
+        # مستخدم وهمي يشغل العمال حتى نملأ الطوابير ونتحكم بلحظة البدء
+        for _ in range(count):
+            scheduler.submit(0, self.gate.wait, admit=False)
+        self.wait_for(lambda: scheduler.stats()["running"] == count)
+
+    def wait_for(self, condition, timeout: float = 5):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            if time.monotonic() > deadline:
+                self.fail("timed out waiting for scheduler")
+            time.sleep(0.01)
+
+    def drain(self, scheduler: FairScheduler):
+        self.gate.set()
+        self.wait_for(lambda: scheduler.stats()["queued"] == 0 and scheduler.stats()["running"] == 0)
+
+
+class TokenBucketTest(unittest.TestCase):
+
+    def test_take_reports_wait_until_enough_tokens(self):
+        bucket = TokenBucket(rate=1, capacity=2)
+        self.assertEqual(bucket.take(), 0)
+        self.assertEqual(bucket.take(), 0)
+        wait = bucket.take()
+        self.assertGreater(wait, 0.9)
+        self.assertLessEqual(wait, 1)
+        self.assertAlmostEqual(bucket.take(2), 2, delta=0.1)
+
+
+class AdmissionTest(SchedulerTestCase):
+
+    def test_rate_limit_rejects_with_retry_after(self):
+        scheduler = self.make(rate_per_minute=60, burst=2)
+        self.block_workers(scheduler)
+        self.assertTrue(scheduler.submit(1, self.task, 1)[0])
+        self.assertTrue(scheduler.submit(1, self.task, 1)[0])
+
+        accepted, retry_after, position = scheduler.submit(1, self.task, 1)
+        self.assertFalse(accepted)
+        self.assertGreater(retry_after, 0.9)
+        self.assertLessEqual(retry_after, 1)
+        self.assertEqual(position, 0)
+        self.assertEqual(scheduler.stats()["throttled_rate"], 1)
+
+        # المستخدمون الآخرون لهم دلاء مستقلة
+        self.assertTrue(scheduler.submit(2, self.task, 2)[0])
+
+    def test_batch_is_charged_a_token_per_task(self):
+        scheduler = self.make(rate_per_minute=60, burst=3)
+        self.block_workers(scheduler)
+        accepted, retry_after, _ = scheduler.submit_many(1, [(self.task, (1,))] * 4)
+        self.assertFalse(accepted)
+        self.assertGreater(retry_after, 0.9)
+
+        self.assertTrue(scheduler.submit_many(1, [(self.task, (1,))] * 3)[0])
+        self.assertFalse(scheduler.submit(1, self.task, 1)[0])
+        self.assertEqual(scheduler.stats()["queued"], 3)
+
+    def test_capacity_reports_admissible_part_of_batch(self):
+        scheduler = self.make(rate_per_minute=60, burst=3)
+        self.block_workers(scheduler)
+        self.assertEqual(scheduler.capacity(1, 2), (2, 0))
+        scheduler.submit(1, self.task, 1)
+
+        admitted, retry_after = scheduler.capacity(1, 5)
+        self.assertEqual(admitted, 2)
+        # بعد قبول الرابطين يلزم 3 رموز جديدة للباقي
+        self.assertAlmostEqual(retry_after, 3, delta=0.1)
+        self.assertEqual(scheduler.capacity(ADMIN, 50), (50, 0))
+        # الاستعلام لا يستهلك رموزاً
+        self.assertTrue(scheduler.submit_many(1, [(self.task, (1,))] * 2)[0])
+
+    def test_concurrency_cap_per_user(self):
+        scheduler = self.make(max_per_user=2)
+        self.block_workers(scheduler)
+        self.assertTrue(scheduler.submit(1, self.task, 1)[0])
+        self.assertTrue(scheduler.submit(1, self.task, 1)[0])
+        self.assertEqual(scheduler.submit(1, self.task, 1), (False, 0, 0))
+        self.assertEqual(scheduler.stats()["throttled_concurrency"], 1)
+
+        self.drain(scheduler)
+        self.assertTrue(scheduler.submit(1, self.task, 1)[0])
+
+    def test_admin_bypasses_limits(self):
+        scheduler = self.make(rate_per_minute=1, burst=1, max_per_user=1)
+        self.block_workers(scheduler)
+        for _ in range(5):
+            self.assertTrue(scheduler.submit(ADMIN, self.task, ADMIN)[0])
+
+
+class DispatchTest(SchedulerTestCase):
+
+    def test_round_robin_with_admin_first(self):
+        scheduler = self.make()
+        self.block_workers(scheduler)
+
+        positions = [scheduler.submit(1, self.task, 1)[2] for _ in range(3)]
+        positions += [scheduler.submit(2, self.task, 2)[2] for _ in range(2)]
+        positions.append(scheduler.submit(ADMIN, self.task, ADMIN)[2])
+        self.drain(scheduler)
+
+        self.assertEqual(self.order, [ADMIN, 1, 2, 1, 2, 1])
+        self.assertEqual(positions, [1, 2, 3, 2, 4, 1])
+
+    def test_batch_position_is_its_first_task(self):
+        scheduler = self.make()
+        self.block_workers(scheduler)
+        scheduler.submit(1, self.task, 1)
+        scheduler.submit(1, self.task, 1)
+
+        _, _, position = scheduler.submit_many(2, [(self.task, (2,))] * 3)
+        self.drain(scheduler)
+
+        self.assertEqual(position, 2)
+        self.assertEqual(self.order, [1, 2, 1, 2, 2])
+
+    def test_running_tasks_capped_per_user(self):
+        scheduler = self.make(workers=4, max_per_user=2)
+        scheduler.submit_many(1, [(self.task, (1, 0.1))] * 6, admit=False)
+        scheduler.submit(2, self.task, 2, 0.1)
+        self.wait_for(lambda: scheduler.stats()["completed"] == 7)
+
+        self.assertEqual(self.peak[1], 2)
+        # المستخدم الثاني لم ينتظر انتهاء دفعة الأول
+        self.assertLess(self.order.index(2), 3)
+
+    def test_failed_task_is_counted_and_frees_slot(self):
+        scheduler = self.make(max_per_user=1)
+        scheduler.submit(1, lambda: 1 / 0)
+        self.wait_for(lambda: scheduler.stats()["failed"] == 1)
+        self.assertTrue(scheduler.submit(1, self.task, 1)[0])
+
+
+if __name__ == "__main__":
+    unittest.main()